@@ -0,0 +1 @@
+# 让 pytest 把仓库根目录加入 sys.path，tests/ 下的测试才能导入根目录中的模块 (如 video_synthesizer)
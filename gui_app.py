@@ -108,7 +108,9 @@ class WorkerThread(QThread):
             synthesis_success = self.create_video_from_data(
                 processed_data,
                 temp_run_dir,
-                final_video_path
+                final_video_path,
+                # 合成进度 (编码 + 拼接 + 字幕烧录) 映射到 40~95 区间；信号跨线程发射，Qt 会排队到 GUI 线程
+                progress_callback=lambda f: self.progress_signal.emit(40 + int(f * 55), "正在合成视频")
             )
             if not synthesis_success:
                 raise RuntimeError("视频合成失败。请检查日志。")
@@ -135,7 +135,7 @@ FFPROBE_PATH_RESOLVED = get_ffmpeg_tool_path("ffprobe")
 ## --- 工具函数 (get_audio_duration - 使用 FFprobe 重写) ---
 def get_audio_duration(filepath: Path) -> float | None:
     """
-    使用 FFprobe 获取音频文件的准确时长 (秒)。
+    获取音频文件的准确时长 (秒)：安装了 mutagen 时只读文件头，否则 (或读取失败时) 使用 FFprobe。
 
     Args:
         filepath: 音频文件的 Path 对象。
@@ -146,6 +146,15 @@ def get_audio_duration(filepath: Path) -> float | None:
     if not filepath or not filepath.is_file():
         logging.warning(f"尝试获取时长失败，文件无效或不存在: {filepath}")
         return None
+    # 优先用 mutagen 只读文件头 (MP3 帧头 / Xing 头)，省去每个片段启动一次 ffprobe 进程
+    if MUTAGEN_AVAILABLE:
+        try:
+            audio = MutagenFile(str(filepath))
+            if audio is not None and audio.info.length > 0.01:
+                logging.debug(f"从 mutagen 获取 {filepath.name} 时长: {audio.info.length:.3f}s")
+                return audio.info.length
+        except (MutagenError, OSError) as e:
+            logging.debug(f"mutagen 读取时长失败，回退到 ffprobe: {filepath.name}: {e}")
     if FFPROBE_PATH_RESOLVED is None:
         logging.error("无法获取音频时长，因为找不到 ffprobe。")
         return None
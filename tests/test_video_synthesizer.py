@@ -0,0 +1,55 @@
+"""video_synthesizer 的单元测试 (需要安装 requirements.txt 中的依赖，在仓库根目录运行 pytest)。"""
+import importlib.util
+import unittest
+
+import pytest
+
+# video_synthesizer 导入时缺少 Pillow 或 Whisper 后端会直接退出；只在缺少这些依赖时跳过，其他导入错误照常报错
+pytest.importorskip("PIL")
+if importlib.util.find_spec("faster_whisper") is None and importlib.util.find_spec("stable_whisper") is None:
+    pytest.skip("需要安装 faster-whisper 或 stable-ts", allow_module_level=True)
+
+import video_synthesizer as vs
+
+
+class ElementaryFrameTimelineTest(unittest.TestCase):
+    def _drift(self, durations):
+        """返回 (音频总时长 - 视频总时长) 以及每个片段的帧数。"""
+        plan = [{'duration': d} for d in durations]
+        counts = [(v, a) for _, v, a in vs.elementary_frame_timeline(plan)]
+        video_seconds = sum(v for v, _ in counts) / vs.TARGET_FPS
+        audio_seconds = sum(a for _, a in counts) * vs.AAC_FRAME_SAMPLES / vs.AAC_SAMPLE_RATE
+        return audio_seconds - video_seconds, counts
+
+    def test_many_segments_do_not_drift(self):
+        aac_frame_seconds = vs.AAC_FRAME_SAMPLES / vs.AAC_SAMPLE_RATE
+        for durations in ([3.0] * 100, [3.217] * 500, [1.04 + (i % 7) * 0.37 for i in range(1000)]):
+            drift, _ = self._drift(durations)
+            self.assertLess(abs(drift), aac_frame_seconds)
+
+    def test_video_matches_rounded_timeline(self):
+        durations = [2.34, 0.02, 5.55, 1.0]
+        _, counts = self._drift(durations)
+        self.assertEqual(sum(v for v, _ in counts), round(sum(durations) * vs.TARGET_FPS))
+        self.assertTrue(all(v >= 1 and a >= 2 for v, a in counts)) # 极短片段也至少有一帧
+
+    def test_accepts_generator(self):
+        plan = ({'duration': 1.5, 'slide_number': i} for i in range(3))
+        self.assertEqual([seg['slide_number'] for seg, _, _ in vs.elementary_frame_timeline(plan)], [0, 1, 2])
+
+
+class SubtitleTimelineTest(unittest.TestCase):
+    def test_clip_starts_include_silent_slides(self):
+        plan = [
+            {'audio_path': '/a/1.wav', 'duration': 2.5},
+            {'audio_path': None, 'duration': 3.0}, # 无旁白的幻灯片 (默认时长) 同样占用时间
+            {'audio_path': '/a/3.wav', 'duration': 4.0},
+        ]
+        self.assertEqual(vs.subtitle_clips(plan), [('/a/1.wav', 0.0), ('/a/3.wav', 5.5)])
+
+    def test_stitch_offsets_each_transcript_by_its_start(self):
+        transcripts = [[(0.0, 1.0, "一"), (1.2, 2.4, "二")], [], [(0.5, 1.5, "三")]]
+        self.assertEqual(
+            vs.stitch_transcripts(transcripts, [0.0, 2.5, 5.5]),
+            [(0.0, 1.0, "一"), (1.2, 2.4, "二"), (6.0, 7.0, "三")],
+        )
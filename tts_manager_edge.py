@@ -7,6 +7,7 @@ from pathlib import Path
 import os
 import wave
 import contextlib
+import functools
 
 # --- 日志记录配置 ---
 logging.basicConfig(
@@ -76,9 +77,9 @@ def run_async_in_sync(async_func):
 
 
 # --- TTS 功能函数 ---
-def get_available_voices() -> list[dict]:
-    """返回预定义的 Edge TTS 语音列表。"""
-    logging.info("获取预定义的 Edge TTS 语音列表。")
+@functools.lru_cache(maxsize=1)
+def _sorted_voice_list() -> tuple[dict, ...]:
+    """构建按显示名称排序的语音列表 (KNOWN_EDGE_VOICES 运行期间不变，只构建一次)。"""
     voice_list = []
     for voice_id, details in KNOWN_EDGE_VOICES.items():
         voice_info = details.copy()
@@ -86,7 +87,12 @@ def get_available_voices() -> list[dict]:
         voice_list.append(voice_info)
     # 按显示名称排序
     voice_list.sort(key=lambda x: x.get('name', ''))
-    return voice_list
+    return tuple(voice_list)
+
+def get_available_voices() -> list[dict]:
+    """返回预定义的 Edge TTS 语音列表。"""
+    logging.info("获取预定义的 Edge TTS 语音列表。")
+    return list(_sorted_voice_list()) # 返回新列表，调用者增删元素不影响缓存
 
 async def _synthesize_edge_audio(voice_id: str, text: str, output_path: Path, rate_str: str = "+0%"): # <<< 移除 pitch_str 参数
     """异步执行 Edge TTS 合成并保存到文件。"""
@@ -98,17 +104,19 @@ async def _synthesize_edge_audio(voice_id: str, text: str, output_path: Path, ra
     logging.debug(f"异步合成完成，已保存到: {output_path.name}")
 
 
-def generate_preview_audio(voice_id: str, text: str | None = None) -> str | None:
+def generate_preview_audio(voice_id: str, text: str | None = None, out_path: str | Path | None = None) -> str | None:
     """
     使用指定的 Edge TTS voice_id 生成一小段预览音频 (MP3)。
 
     Args:
         voice_id: 要使用的语音 ID (例如 'zh-CN-XiaoxiaoNeural')。
         text: (可选) 要转换为语音的示例文本。如果为 None，会根据语音语言选择默认文本。
+        out_path: (可选) 输出文件路径，已存在时原地覆盖 (便于调用者复用固定的几个文件)。
+                  为 None 时创建新的临时文件。
 
     Returns:
-        成功生成的临时音频文件 (mp3) 的绝对路径。如果失败则返回 None。
-        注意：调用者负责在使用后删除此临时文件。
+        成功生成的音频文件 (mp3) 的绝对路径。如果失败则返回 None。
+        注意：调用者负责在使用后删除此文件。
     """
     logging.info(f"请求 Edge TTS 预览: Voice ID='{voice_id}'")
     if voice_id not in KNOWN_EDGE_VOICES:
@@ -125,10 +133,13 @@ def generate_preview_audio(voice_id: str, text: str | None = None) -> str | None
 
     temp_file_path = None
     try:
-        # Edge TTS 通常输出 MP3
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_f:
-            temp_file_path = Path(tmp_f.name)
-        logging.info(f"创建临时预览文件: {temp_file_path}")
+        if out_path is not None:
+            temp_file_path = Path(out_path) # 以 'wb' 写入，会截断旧内容
+        else:
+            # Edge TTS 通常输出 MP3
+            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_f:
+                temp_file_path = Path(tmp_f.name)
+            logging.info(f"创建临时预览文件: {temp_file_path}")
         
         # --- 运行异步合成 (调用修改后的 _synthesize_edge_audio) ---
         async_task = _synthesize_edge_audio(voice_id, text, temp_file_path) # 不再传 pitch
@@ -2,6 +2,8 @@ import os
 import logging
 import time
 import shutil
+import errno
+import stat
 from pathlib import Path
 import subprocess
 import shlex
@@ -11,6 +13,17 @@ import configparser # 导入配置解析器
 import sys # 导入 sys
 os.environ['TQDM_DISABLE'] = '1' # <--- 在调用 Whisper 前设置环境变量禁用 TQDM
 import platform # 导入 platform
+import functools
+import threading
+import atexit
+import collections
+import hashlib
+import json
+import re
+import tempfile
+import queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections.abc import Callable, Iterable, Iterator
 
 # --- 配置解析 ---
 config = configparser.ConfigParser()
@@ -34,27 +47,48 @@ logging.basicConfig(
 )
 
 # --- 导入其他库 ---
+try:
+    from faster_whisper import WhisperModel as FasterWhisperModel # 可选：CTranslate2 int8 后端
+except ImportError:
+    FasterWhisperModel = None
 try:
     import stable_whisper
 except ImportError:
-    logging.error("缺少 'stable-ts' 库。请运行 'pip install stable-ts'。")
+    stable_whisper = None
+if FasterWhisperModel is None and stable_whisper is None:
+    logging.error("缺少 'stable-ts' 库。请运行 'pip install stable-ts' (或 'pip install faster-whisper')。")
     sys.exit(1) # <--- 使用 sys.exit(1)
 try:
     import opencc # 新增：导入 opencc 库
 except ImportError:
     logging.warning("缺少 'opencc-python-reimplemented' 库，将无法进行繁简转换！")
     opencc = None # 如果没有安装，设置为 None
+_OPENCC = None # 繁体 -> 简体转换器，构造时需加载词典，只创建一次
+if opencc:
+    try:
+        _OPENCC = opencc.OpenCC('t2s.json')
+    except Exception as e:
+        logging.error(f"创建 OpenCC 转换器失败: {e}。将跳过繁简转换。")
 try:
-    from PIL import Image
+    import soundfile # 可选：libsndfile 只读文件头获取时长
+except ImportError:
+    soundfile = None
+try:
+    from PIL import Image, ImageOps
 except ImportError:
     logging.error("缺少 'Pillow' 库。请运行 'pip install Pillow'。")
     sys.exit(1) # <--- 使用 sys.exit(1)
+try:
+    import av # 可选：PyAV 进程内编码后端
+except ImportError:
+    av = None
 
 
 
 
+@functools.lru_cache(maxsize=1)
 def get_ffmpeg_path():
-    """Determines the path to the bundled ffmpeg executable."""
+    """Determines the path to the bundled ffmpeg executable (resolved once, then cached)."""
     if getattr(sys, 'frozen', False):
         # If the application is run as a bundle (frozen),
         # find ffmpeg relative to the executable directory.
@@ -62,15 +96,8 @@ def get_ffmpeg_path():
         # Adjust 'vendor' if you used a different folder name
         ffmpeg_executable = application_path / "vendor" / "ffmpeg.exe"
     else:
-        # If running as a normal script, try PATH or config
-        config = configparser.ConfigParser()
-        config_path = Path(__file__).parent / 'config.ini'
-        ffmpeg_in_config = 'ffmpeg' # Default
-        if config_path.exists():
-            try:
-                config.read(config_path, encoding='utf-8')
-                ffmpeg_in_config = config.get('Paths', 'ffmpeg_path', fallback='ffmpeg')
-            except Exception: pass # Ignore config errors here
+        # If running as a normal script, try PATH or config (module-level config is already parsed)
+        ffmpeg_in_config = config.get('Paths', 'ffmpeg_path', fallback='ffmpeg')
         # Check if the path from config/default exists or search PATH
         ffmpeg_executable_found = shutil.which(ffmpeg_in_config)
         if ffmpeg_executable_found:
@@ -98,13 +125,136 @@ def get_ffmpeg_path():
 FFMPEG_PATH_RESOLVED = get_ffmpeg_path()
 
 # --- 从 config 读取配置 ---
-TARGET_WIDTH = config.getint('Video', 'target_width', fallback=1280)
-TARGET_FPS = config.getint('Video', 'target_fps', fallback=24)
-WHISPER_MODEL = config.get('Audio', 'whisper_model', fallback='base')
-DEFAULT_SLIDE_DURATION = config.getfloat('Video', 'default_slide_duration', fallback=3.0)
+# 随附的 config.ini 使用中文节名；旧的英文节名 ([Video]/[Audio]) 仍然兼容
+VIDEO_SECTION = '视频设置' if config.has_section('视频设置') else 'Video'
+AUDIO_SECTION = '音频设置' if config.has_section('音频设置') else 'Audio'
+TARGET_WIDTH = config.getint(VIDEO_SECTION, 'target_width', fallback=1280)
+TARGET_FPS = config.getint(VIDEO_SECTION, 'target_fps', fallback=10) # 幻灯片画面静止，10 fps 足够，输出帧数只有 24 fps 的 40%
+WHISPER_MODEL = config.get(AUDIO_SECTION, 'whisper_model', fallback='base')
+# ASR 后端: 'auto' (优先 faster-whisper), 'faster_whisper' 或 'stable_whisper' (兼容旧行为)
+ASR_BACKEND = config.get(AUDIO_SECTION, 'asr_backend', fallback='auto').strip().lower()
+# 字幕识别语言: 'auto' 只在最长的一段音频上检测一次，其余片段沿用；也可指定 Whisper 语言代码 (如 zh / en)
+ASR_LANGUAGE = config.get(AUDIO_SECTION, 'asr_language', fallback='auto').strip().lower()
+# 是否在进程内缓存已加载的 Whisper 模型 (批量处理多个演示文稿时避免重复加载)
+CACHE_WHISPER_MODEL = config.getboolean(AUDIO_SECTION, 'cache_whisper_model', fallback=True)
+DEFAULT_SLIDE_DURATION = config.getfloat(VIDEO_SECTION, 'default_slide_duration', fallback=3.0)
+# 标准化滤镜 (缩放 -> 填充到 16:9 -> 方形像素 -> 像素格式 -> 帧率)，宽度/帧率为模块常量，只需构建一次
+_VF_STANDARD = (
+    f"scale={TARGET_WIDTH}:-2:force_original_aspect_ratio=decrease,"
+    f"pad={TARGET_WIDTH}:{TARGET_WIDTH*9//16}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p,fps={TARGET_FPS}"
+)
+# 已由 prepare_image 预先缩放/填充到目标分辨率的图片只需转换像素格式和帧率
+_VF_PREPARED = f"setsar=1,format=yuv420p,fps={TARGET_FPS}"
 # 字幕样式现在从配置读取 (但可能需要进一步处理才能用于 FFmpeg)
-SUBTITLE_STYLE_CONFIG = config.get('Video', 'subtitle_style', fallback="force_style='FontName=Arial,FontSize=24'") # 简化默认值
+SUBTITLE_STYLE_CONFIG = config.get(VIDEO_SECTION, 'subtitle_style', fallback="force_style='FontName=Arial,FontSize=24'") # 简化默认值
 FFMPEG_PATH = config.get('Paths', 'ffmpeg_path', fallback='ffmpeg')
+# 单次合成：所有片段在一个 FFmpeg filtergraph 中完成缩放/拼接/字幕并只编码一次
+SINGLE_PASS_RENDER = config.getboolean(VIDEO_SECTION, 'single_pass_render', fallback=True)
+# True: 字幕烧录进画面 (需要重新编码)；False: 作为软字幕 (mov_text) 轨道封装，只需 -c copy
+HARDCODE_SUBTITLES = config.getboolean(VIDEO_SECTION, 'hardcode_subtitles', fallback=True)
+SUBTITLE_LANGUAGE = config.get(VIDEO_SECTION, 'subtitle_language', fallback='zho') # 软字幕轨道的 ISO 639-2 语言标记
+# 合成后端: 'ffmpeg' (调用 FFmpeg 命令行) 或 'pyav' (进程内单一编码器，需要安装 av)
+RENDER_BACKEND = config.get(VIDEO_SECTION, 'render_backend', fallback='ffmpeg').strip().lower()
+# 硬件编码器: 'auto' 自动检测, 'none' 强制 libx264, 或指定 'nvenc' / 'qsv' / 'vaapi' / 'videotoolbox'
+HW_ENCODER = config.get(VIDEO_SECTION, 'hw_encoder', fallback='auto').strip().lower()
+VAAPI_DEVICE = config.get(VIDEO_SECTION, 'vaapi_device', fallback="/dev/dri/renderD128")
+
+# 硬件编码器名称 -> FFmpeg 编码器
+_HW_ENCODER_CODECS = {
+    'nvenc': 'h264_nvenc',
+    'qsv': 'h264_qsv',
+    'vaapi': 'h264_vaapi',
+    'videotoolbox': 'h264_videotoolbox',
+}
+# 幻灯片画面基本静止：关闭 B 帧/场景切换检测、只用 1 个参考帧，大幅减少 x264 的分析开销
+X264_SLIDE_PARAMS = f"keyint={2 * TARGET_FPS}:scenecut=0:ref=1:bframes=0" # 每 2 秒一个关键帧，与帧率无关
+MP4_FASTSTART_ARGS = ["-movflags", "+faststart"] # moov 放到文件头，便于边下边播
+NVENC_MAX_SESSIONS = 3 # 消费级 NVIDIA 显卡限制同时进行的 NVENC 编码会话数
+SEGMENT_FFMPEG_THREADS = 2 # 并行编码片段时每个 FFmpeg 进程的线程数，避免线程超额订阅
+
+
+@functools.lru_cache(maxsize=1)
+def detect_hw_encoder() -> str | None:
+    """
+    检测可用的 H.264 硬件编码器 (只运行一次，结果缓存)。
+
+    先查询 `ffmpeg -encoders`，再用一次极短的试编码确认硬件确实可用
+    (编码器被编译进 FFmpeg 不代表机器上有对应的 GPU)。
+
+    Returns:
+        'nvenc' / 'qsv' / 'vaapi' / 'videotoolbox'，不可用时返回 None (使用 libx264)。
+    """
+    if HW_ENCODER == 'none' or FFMPEG_PATH_RESOLVED is None:
+        return None
+    if HW_ENCODER != 'auto':
+        if HW_ENCODER not in _HW_ENCODER_CODECS:
+            logging.warning(f"未知的 hw_encoder 配置 '{HW_ENCODER}'，使用 libx264。")
+            return None
+        candidates = [HW_ENCODER]
+    elif platform.system() == "Darwin":
+        candidates = ['videotoolbox']
+    else:
+        candidates = ['nvenc', 'qsv', 'vaapi']
+
+    try:
+        result = subprocess.run([FFMPEG_PATH_RESOLVED, "-hide_banner", "-encoders"],
+                                capture_output=True, text=True, encoding='utf-8', errors='ignore', timeout=10)
+        available = result.stdout
+    except Exception as e:
+        logging.debug(f"查询 FFmpeg 编码器列表失败: {e}")
+        return None
+
+    for name in candidates:
+        codec = _HW_ENCODER_CODECS[name]
+        if codec not in available:
+            continue
+        if name == 'vaapi' and not Path(VAAPI_DEVICE).exists():
+            continue
+        probe_cmd = [FFMPEG_PATH_RESOLVED, "-hide_banner", "-v", "error", *encoder_global_args(name),
+                     "-f", "lavfi", "-i", "color=c=black:s=256x144:d=0.1",
+                     "-vf", "format=yuv420p" + video_filter_suffix(name),
+                     "-c:v", codec, "-f", "null", "-"]
+        try:
+            probe = subprocess.run(probe_cmd, capture_output=True, timeout=15)
+            if probe.returncode == 0:
+                logging.info(f"检测到可用的硬件编码器: {codec}")
+                return name
+            logging.debug(f"硬件编码器 {codec} 试编码失败，跳过。")
+        except Exception as e:
+            logging.debug(f"硬件编码器 {codec} 试编码出错: {e}")
+    logging.info("未检测到可用的硬件编码器，使用 libx264。")
+    return None
+
+
+def encoder_global_args(hw: str | None = None) -> list[str]:
+    """硬件编码器需要的全局参数 (VAAPI 需指定设备)。"""
+    return ["-vaapi_device", VAAPI_DEVICE] if hw == 'vaapi' else []
+
+
+def video_filter_suffix(hw: str | None = None) -> str:
+    """追加到视频滤镜链末尾的内容 (VAAPI 需要把帧上传到 GPU)。"""
+    return ",format=nv12,hwupload" if hw == 'vaapi' else ""
+
+
+def video_encoder_args(hw: str | None, preset: str, crf: int) -> list[str]:
+    """
+    返回视频编码参数 (-c:v 及质量控制)。
+
+    Args:
+        hw: detect_hw_encoder() 的结果，None 表示 libx264。
+        preset: libx264 预设 (硬件编码器使用各自的预设)。
+        crf: 质量参数，映射到各编码器的恒定质量选项。
+    """
+    if hw == 'nvenc':
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", str(crf), "-b:v", "0", "-pix_fmt", "yuv420p"]
+    if hw == 'qsv':
+        return ["-c:v", "h264_qsv", "-preset", "veryfast", "-global_quality", str(crf), "-pix_fmt", "nv12"]
+    if hw == 'vaapi':
+        return ["-c:v", "h264_vaapi", "-qp", str(crf)]
+    if hw == 'videotoolbox':
+        return ["-c:v", "h264_videotoolbox", "-b:v", "4M", "-pix_fmt", "yuv420p"]
+    return ["-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+            "-tune", "stillimage", "-x264-params", X264_SLIDE_PARAMS, "-pix_fmt", "yuv420p"]
 
 
 
@@ -121,20 +271,54 @@ FFMPEG_PATH = config.get('Paths', 'ffmpeg_path', fallback='ffmpeg')
 # FFMPEG_PATH = "ffmpeg"   # 假设 ffmpeg 在 PATH 中，否则指定完整路径
 
 # --- ASR 字幕生成函数 (基本保持不变) ---
+# 时长缓存: (路径, 修改时间) -> 秒
+_DUR_CACHE: dict[tuple[str, float], float] = {}
+
+def regular_file_size(path: "str | os.PathLike") -> int:
+    """一次 stat 同时判断是否为普通文件并取得大小；不存在或不是普通文件时返回 -1。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return -1
+    return st.st_size if stat.S_ISREG(st.st_mode) else -1
+
 def get_wav_duration(filepath: Path) -> float:
-    """获取 WAV 文件的时长（秒）。"""
-    if not filepath.is_file():
+    """获取 WAV 文件的时长（秒）。结果按 (路径, mtime) 缓存。"""
+    try:
+        st = filepath.stat()
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         logging.warning(f"尝试获取时长失败，文件不存在: {filepath}")
         return 0.0
+    key = (str(filepath), st.st_mtime)
+    cached = _DUR_CACHE.get(key)
+    if cached:
+        return cached
+
+    duration = 0.0
+    if soundfile is not None:
+        try:
+            duration = soundfile.info(str(filepath)).duration
+        except Exception as e:
+            logging.debug(f"soundfile 读取时长失败，回退到 wave: {filepath}: {e}")
+            duration = 0.0
+    if not duration:
+        duration = _read_wav_header_duration(filepath)
+    if duration > 0:
+        _DUR_CACHE[key] = duration
+    return duration
+
+def _read_wav_header_duration(filepath: Path) -> float:
+    """使用标准库 wave 读取 WAV 文件头计算时长。"""
     try:
         with contextlib.closing(wave.open(str(filepath), 'r')) as f:
-            frames = f.getnframes()
-            rate = f.getframerate()
+            frames: int = f.getnframes()
+            rate: int = f.getframerate()
             if rate == 0:
                 logging.warning(f"文件采样率读取为零: {filepath}")
                 return 0.0
-            duration = frames / float(rate)
-            return duration
+            return frames / rate
     except wave.Error as e:
         logging.error(f"读取 WAV 文件头出错 {filepath}: {e}")
         return 0.0
@@ -142,105 +326,252 @@ def get_wav_duration(filepath: Path) -> float:
         logging.error(f"获取 WAV 时长时发生意外错误 {filepath}: {e}")
         return 0.0
 
-def srt_formatter(result: stable_whisper.WhisperResult, **kwargs) -> str:
-    """将 stable-ts 结果格式化为 SRT"""
-    return result.to_srt_vtt(word_level=False) # 使用段落级别的 SRT
+# 匹配任意一行：非空白、不是纯数字序号、不含时间轴箭头 (即字幕文本行)
+_SRT_TEXT_RE = re.compile(rb'^(?!\s*$)(?!\s*\d+\s*$)(?!.*-->).+', re.M)
+
+def srt_has_text(buf: bytes) -> bool:
+    """检查 SRT 内容是否包含有效文本：用预编译正则在 C 层面一次扫描整个缓冲区。"""
+    return _SRT_TEXT_RE.search(buf) is not None
+
+_SRT_SKELETON_BYTES = b"0123456789:, ->\r\n" # 序号行与时间轴行只会用到的字符
+
+def format_srt_timestamp(seconds: float) -> str:
+    """将秒数格式化为 SRT 时间戳 (HH:MM:SS,mmm)。"""
+    total_ms = max(0, int(round(seconds * 1000)))
+    hours, rem = divmod(total_ms, 3600_000)
+    minutes, rem = divmod(rem, 60_000)
+    secs, ms = divmod(rem, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{ms:03d}"
+
+def srt_formatter(segments: list[tuple[float, float, str]], **kwargs) -> str:
+    """将 (start, end, text) 段落列表格式化为 SRT (段落级别，重新编号)。"""
+    cues = []
+    for start, end, text in segments:
+        text = text.strip()
+        if not text:
+            continue
+        cues.append(f"{len(cues) + 1}\n{format_srt_timestamp(start)} --> {format_srt_timestamp(end)}\n{text}\n")
+    return "\n".join(cues)
+
+_WHISPER_CACHE: dict[str, tuple[str, object]] = {} # 模型名 -> (backend, model)，进程内只加载一次
+_WHISPER_CACHE_LOCK = threading.Lock() # ASR 在后台线程中运行，避免并发重复加载
+atexit.register(_WHISPER_CACHE.clear) # 退出时先释放模型，避免解释器关闭阶段再析构 torch/CTranslate2 对象
+
+def load_whisper_model(model_name: str):
+    """
+    加载 Whisper 模型 (cache_whisper_model 开启时带进程内缓存)。优先使用 faster-whisper (int8 量化)，否则回退到 stable-ts。
+
+    Returns:
+        (backend, model) 元组，backend 为 'faster_whisper' 或 'stable_whisper'。
+    """
+    if not CACHE_WHISPER_MODEL:
+        return _load_whisper_model_uncached(model_name)
+    with _WHISPER_CACHE_LOCK:
+        cached = _WHISPER_CACHE.get(model_name)
+        if cached is None:
+            cached = _WHISPER_CACHE.setdefault(model_name, _load_whisper_model_uncached(model_name))
+        else:
+            logging.info(f"复用已加载的 Whisper 模型 '{model_name}'。")
+        return cached
+
+def selected_asr_backend() -> str:
+    """按配置与已安装的库确定实际使用的 ASR 后端 ('faster_whisper' 或 'stable_whisper')，不加载模型。"""
+    if FasterWhisperModel is not None and (ASR_BACKEND != 'stable_whisper' or stable_whisper is None):
+        return 'faster_whisper'
+    return 'stable_whisper'
+
+def _load_whisper_model_uncached(model_name: str):
+    if selected_asr_backend() == 'faster_whisper':
+        # GPU 上权重 int8、激活 float16；CPU 上全部 int8
+        device, compute_type = ("cuda", "int8_float16") if _ctranslate2_cuda_available() else ("cpu", "int8")
+        logging.info(f"使用 faster-whisper 后端 ({device}, {compute_type}) 加载模型 '{model_name}'...")
+        return 'faster_whisper', FasterWhisperModel(
+            model_name, device=device, compute_type=compute_type, cpu_threads=os.cpu_count() or 0
+        )
+    if ASR_BACKEND == 'faster_whisper':
+        logging.warning("配置要求使用 faster-whisper，但未安装该库，改用 stable-ts。")
+    logging.info(f"使用 stable-ts 后端加载模型 '{model_name}'...")
+    return 'stable_whisper', stable_whisper.load_model(model_name)
+
+def _ctranslate2_cuda_available() -> bool:
+    """检测 CTranslate2 (faster-whisper 的推理后端) 是否可用 CUDA 设备。"""
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count() > 0
+    except Exception:
+        return False
+
+def _cuda_available() -> bool:
+    """检测 torch 是否可用 CUDA (用于决定是否启用 fp16)。"""
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+def transcribe_segments(
+    backend: str, model, audio_file: str, language: str | None = None
+) -> tuple[list[tuple[float, float, str]], str | None]:
+    """
+    对单个音频文件运行 ASR，返回 ((start, end, text) 段落列表, 识别所用的语言)。
+    language 为 None 时由 Whisper 自动检测语言。
+    """
+    if backend == 'faster_whisper':
+        # vad_filter 跳过静音部分，既减少计算量也避免在静音上产生幻觉文本
+        segments, info = model.transcribe(audio_file, beam_size=1, vad_filter=True, language=language)
+        return [(seg.start, seg.end, seg.text) for seg in segments], info.language # segments 为生成器，在此处实际执行识别
+    result = model.transcribe(
+        audio_file,
+        language=language,
+        fp16=_cuda_available(), # 仅在 GPU 上使用 FP16，CPU 上 FP16 不受支持
+        verbose=False,
+    )
+    return [(seg.start, seg.end, seg.text) for seg in result.segments], getattr(result, 'language', None) or language
+
+def stitch_transcripts(
+    transcripts: list[list[tuple[float, float, str]]], start_times: list[float]
+) -> list[tuple[float, float, str]]:
+    """把各片段的识别结果按片段在成片中的起点 (秒) 偏移，合并为一条时间轴。"""
+    return [
+        (start + offset, end + offset, text)
+        for segments, offset in zip(transcripts, start_times)
+        for start, end, text in segments
+    ]
+
+_CJK_RE = re.compile('[\u3400-\u9fff\uf900-\ufaff]') # CJK 统一汉字 (含扩展 A) 与兼容汉字，没有命中就无需繁简转换
+
+ASR_CACHE_MAX_BYTES = 32 * 1024 * 1024 # 识别结果是小 JSON，超过此大小时淘汰最久未用的条目
+
+def user_cache_dir(*parts: str) -> Path:
+    """本应用的按用户缓存目录 (Windows: %LOCALAPPDATA%，macOS: ~/Library/Caches，其他: $XDG_CACHE_HOME 或 ~/.cache)。"""
+    system = platform.system()
+    if system == "Windows":
+        base = Path(os.environ.get('LOCALAPPDATA') or Path.home() / "AppData" / "Local")
+    elif system == "Darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / ".cache")
+    return base.joinpath("ppt2video", *parts)
+
+def trim_cache_dir(cache_dir: Path, pattern: str, max_bytes: int) -> None:
+    """按最近使用时间 (访问/修改时间中较新的一个) 淘汰 cache_dir 中最旧的 pattern 文件，直到总大小低于 max_bytes。"""
+    entries = []
+    for p in cache_dir.glob(pattern):
+        try:
+            entries.append((p, p.stat()))
+        except OSError:
+            continue
+    total = sum(st.st_size for _, st in entries)
+    for p, st in sorted(entries, key=lambda e: max(e[1].st_atime, e[1].st_mtime)):
+        if total < max_bytes:
+            break
+        with contextlib.suppress(OSError):
+            p.unlink()
+            total -= st.st_size
+
+def asr_cache_key(audio_file: str, backend: str, model_name: str, language: str = 'auto') -> str:
+    """按音频内容 + 后端 + 模型名 + 语言设置计算识别结果的缓存键 (blake2b)。"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{backend}\0{model_name}\0{language}\0".encode('utf-8'))
+    h.update(Path(audio_file).read_bytes())
+    return h.hexdigest()
+
+def _load_cached_transcript(cache_file: Path) -> list[tuple[float, float, str]] | None:
+    try:
+        entries = json.loads(cache_file.read_text(encoding='utf-8'))
+        return [(e['start'], e['end'], e['text']) for e in entries]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _store_cached_transcript(cache_file: Path, segments: list[tuple[float, float, str]]) -> None:
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(".tmp")
+        tmp_file.write_text(
+            json.dumps([{'start': a, 'end': b, 'text': t} for a, b, t in segments], ensure_ascii=False),
+            encoding='utf-8'
+        )
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logging.debug(f"写入 ASR 缓存失败 {cache_file}: {e}")
 
 def generate_subtitles(
-    audio_paths: list[str | None],
+    audio_clips: list[tuple[str, float]],
     output_srt_path: Path,
     temp_dir: Path,
     # whisper_model_name: str = WHISPER_MODEL
 ) -> bool:
     """
-    合并音频文件，使用 Whisper 生成 SRT 字幕文件。
-    (使用 MoviePy 合并音频，因为这部分通常没问题且方便)
+    逐个音频片段运行 Whisper，按片段在成片中的起点偏移时间戳后合并为一个 SRT 字幕文件。
+    每个片段的识别结果按内容哈希缓存在用户缓存目录 (见 user_cache_dir) 中，内容未变的片段不再识别；
+    缓存总大小超过 ASR_CACHE_MAX_BYTES 时淘汰最久未用的条目。
+
+    Args:
+        audio_clips: (音频路径, 该片段在成片时间轴上的起点秒数) 列表 (见 subtitle_clips)。
+        output_srt_path: 输出 SRT 文件路径。
+        temp_dir: 临时工作目录。
     """
     logging.info("开始生成字幕...")
-    valid_audio_files = [p for p in audio_paths if p and Path(p).exists() and Path(p).stat().st_size > 100]
+    valid_audio_files = [(p, start) for p, start in audio_clips if p and regular_file_size(p) > 100]
 
     if not valid_audio_files:
         logging.warning("没有有效的音频文件可用于生成字幕。")
         return False
 
-    combined_audio_path = temp_dir / "combined_audio_for_asr.wav"
-    # --- 使用 FFmpeg 合并音频 ---
-    # 创建一个包含所有输入音频文件路径的文本文件 (safe way)
-    concat_list_path = temp_dir / "audio_concat_list.txt"
-    try:
-        with open(concat_list_path, 'w', encoding='utf-8') as f:
-            for audio_file in valid_audio_files:
-                # FFmpeg concat demuxer 需要特定的格式，并处理特殊字符
-                safe_path = str(Path(audio_file).resolve()).replace("'", "'\\''") # 基本的转义
-                f.write(f"file '{safe_path}'\n")
-        logging.info(f"为 FFmpeg 创建了音频合并列表: {concat_list_path.name}")
-
-        cmd_concat = [
-            # FFMPEG_PATH,
-            FFMPEG_PATH_RESOLVED, # <--- 使用 FFMPEG_PATH_RESOLVED
-            "-f", "concat",      # 使用 concat demuxer
-            "-safe", "0",       # 允许非本地/相对路径 (如果需要)
-            "-i", str(concat_list_path.resolve()), # 输入列表文件
-            "-c", "copy",       # 直接复制音频流，不重新编码
-            str(combined_audio_path.resolve()) # 输出合并后的文件
-        ]
-        logging.info(f"执行 FFmpeg 命令合并音频: {' '.join(shlex.quote(c) for c in cmd_concat)}")
-        result = subprocess.run(cmd_concat, capture_output=True, text=True, check=True, encoding='utf-8')
-        if result.stderr: logging.debug(f"FFmpeg (concat) stderr:\n{result.stderr}") # Debug 输出
-        logging.info("使用 FFmpeg 合并音频完成。")
-        # 可选删除列表文件: concat_list_path.unlink()
-        if concat_list_path.exists(): concat_list_path.unlink() # 清理列表文件
-
-    except subprocess.CalledProcessError as e:
-        logging.error(f"FFmpeg 合并音频失败。返回码: {e.returncode}")
-        logging.error(f"FFmpeg 命令: {shlex.join(cmd_concat)}")
-        logging.error(f"FFmpeg 错误输出:\n{e.stderr}")
-        if concat_list_path.exists(): concat_list_path.unlink() # 出错也尝试清理
-        return False
-    except FileNotFoundError:
-        logging.error(f"错误：找不到 '{FFMPEG_PATH_RESOLVED}' 命令。") # 使用 FFMPEG_PATH_RESOLVED
-        if concat_list_path.exists(): concat_list_path.unlink()
-        return False
-    except Exception as e:
-        logging.error(f"合并音频时发生错误: {e}", exc_info=True)
-        if concat_list_path.exists(): concat_list_path.unlink()
-        return False
-
-    # --- 后续 ASR 步骤保持不变 ---
-    model = None # 初始化 model 变量
     original_tqdm_disable = os.environ.get('TQDM_DISABLE') # 保存原始值
 
-
     try:
-        logging.info(f"加载 Whisper 模型 '{WHISPER_MODEL}'...") # 使用全局配置
         asr_start_time = time.time()
-        model = stable_whisper.load_model(WHISPER_MODEL) # 使用全局配置
-        logging.info("开始语音识别 (ASR)...")
-        # result = model.transcribe(str(combined_audio_path), fp16=False, verbose=False)
-        # 重点：这里移除 language='zh' 参数，让 Whisper 自动检测
-        result = model.transcribe(
-            str(combined_audio_path),
-            fp16=False,
-            verbose=False,
-            # language='zh' # 移除此行 (让 Whisper 自动检测语言)
-        )
+        backend = selected_asr_backend()
+        model = None # 只有存在缓存未命中的片段时才加载模型
+        cache_dir = user_cache_dir("asr")
+        cache_hits = 0
+        logging.info(f"开始语音识别 (ASR)，共 {len(valid_audio_files)} 个音频片段...")
+
+        language = None if ASR_LANGUAGE in ('', 'auto') else ASR_LANGUAGE
+        cache_files = [
+            cache_dir / f"{asr_cache_key(str(audio_file), backend, WHISPER_MODEL, ASR_LANGUAGE)}.json"
+            for audio_file, _ in valid_audio_files
+        ]
+        transcripts = [_load_cached_transcript(cache_file) for cache_file in cache_files]
+        for cache_file, segments in zip(cache_files, transcripts):
+            if segments is not None:
+                cache_hits += 1
+                with contextlib.suppress(OSError):
+                    os.utime(cache_file) # 刷新使用时间，淘汰时按最近使用排序 (atime 常被 relatime 延迟更新)
+        # 最长的片段先识别：自动检测语言时只在它上面检测一次，其余片段沿用 (几秒的短片段单独检测容易出错)
+        pending = sorted((i for i, t in enumerate(transcripts) if t is None),
+                         key=lambda i: regular_file_size(valid_audio_files[i][0]), reverse=True)
+        for i in pending:
+            if model is None:
+                logging.info(f"加载 Whisper 模型 '{WHISPER_MODEL}'...") # 使用全局配置
+                backend, model = load_whisper_model(WHISPER_MODEL) # 使用全局配置，模型在进程内缓存复用
+            transcripts[i], detected = transcribe_segments(backend, model, str(valid_audio_files[i][0]), language)
+            if language is None and detected:
+                language = detected
+                logging.info(f"检测到字幕语言: {language}，其余片段沿用。")
+            _store_cached_transcript(cache_files[i], transcripts[i])
+        merged_segments = stitch_transcripts(transcripts, [start for _, start in valid_audio_files])
+        trim_cache_dir(cache_dir, "*.json", ASR_CACHE_MAX_BYTES)
         asr_end_time = time.time()
-        logging.info(f"语音识别完成，耗时 {asr_end_time - asr_start_time:.2f} 秒。")
+        logging.info(f"语音识别完成，耗时 {asr_end_time - asr_start_time:.2f} 秒 (缓存命中 {cache_hits}/{len(valid_audio_files)})。")
 
         logging.info(f"将结果格式化并保存到 {output_srt_path.name}...")
-        
-        srt_content = srt_formatter(result)
+
+        srt_content = srt_formatter(merged_segments)
 
         # --- 繁简转换 (如果 opencc 可用) ---
-        if opencc:
-            try:
-                cc = opencc.OpenCC('t2s.json') # 创建转换器 (繁体 -> 简体)
-                srt_content = cc.convert(srt_content) # 执行转换
-                logging.info("成功使用 OpenCC 将字幕内容转换为简体。")
-            except Exception as e:
-                logging.error(f"OpenCC 转换 SRT 内容时出错: {e}。")
+        if _OPENCC:
+            if _CJK_RE.search(srt_content) is None:
+                logging.debug("字幕中没有汉字，跳过繁简转换。")
+            else:
+                try:
+                    srt_content = _OPENCC.convert(srt_content) # 执行转换 (繁体 -> 简体)
+                    logging.info("成功使用 OpenCC 将字幕内容转换为简体。")
+                except Exception as e:
+                    logging.error(f"OpenCC 转换 SRT 内容时出错: {e}。")
         else:
-            logging.warning("由于 opencc-python-reimplemented 未安装，跳过繁简转换。")
+            logging.warning("OpenCC 不可用 (opencc-python-reimplemented 未安装或初始化失败)，跳过繁简转换。")
         # -------------------------------------
         # 保存 SRT 内容
         with open(output_srt_path, "w", encoding="utf-8") as f:
@@ -257,24 +588,126 @@ def generate_subtitles(
         else:
             os.environ['TQDM_DISABLE'] = original_tqdm_disable
 
-        if model is not None:
-             logging.debug("正在释放 Whisper 模型内存...")
-             del model # <--- 确保在这里删除模型对象
-             # 可以考虑加一个短暂的等待，虽然理论上 del 后引用计数为0就该释放了
-             # time.sleep(0.1)
-        # 可选删除合并后的音频，但这里不删，后面会随整个目录清理
-        # if combined_audio_path.exists(): combined_audio_path.unlink()
-
 # --- FFmpeg 核心功能函数 ---
 
+AAC_SAMPLE_RATE = 44100
+AAC_FRAME_SAMPLES = 1024 # 每个 AAC 帧的采样数
+FFMPEG_PIPE_BUFSIZE = 1 << 20 # 1MB 管道缓冲，减少小块读写的系统调用
+SEGMENT_PROGRESS_SHARE = 0.4 # 逐片段编码 + 烧录字幕时，片段编码在整体进度中所占的比例
+FFMPEG_STDERR_TAIL_CHUNKS = 8 # DEBUG 模式下只保留 stderr 末尾的若干块 (每块最多 8KB，共约 64KB)
+
+def run_ffmpeg(
+    cmd: list[str],
+    log_path: Path,
+    input_bytes: bytes | None = None,
+    progress: "Callable[[float], None] | None" = None
+) -> str:
+    """
+    运行一条 FFmpeg 命令。
+
+    DEBUG 级别时流式读取 stderr，只保留末尾约 64KB 并返回；否则把 stderr 追加写入 log_path，
+    只在命令失败时读回，避免在成功路径上缓冲整段 FFmpeg 日志。
+
+    Args:
+        cmd: FFmpeg 参数列表。
+        log_path: 非 DEBUG 模式下 stderr 的落盘文件 (通常为临时目录下的 ffmpeg.log)。
+        input_bytes: (可选) 通过 stdin 写入的数据。
+        progress: (可选) 进度回调，参数为已输出的时长 (秒)。提供时以 -progress pipe:1 运行，
+                  stderr 总是写入 log_path (不能与 input_bytes 同时使用)。
+
+    Returns:
+        str: DEBUG 模式下 stderr 末尾的文本，否则为空字符串。
+
+    Raises:
+        subprocess.CalledProcessError: 返回码非 0，stderr 字段为文本。
+    """
+    if progress is not None and input_bytes is None:
+        _run_ffmpeg_with_progress(cmd, log_path, progress)
+        return ""
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        returncode, stderr_text = _run_ffmpeg_with_stderr_tail(cmd, input_bytes)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_text)
+        return stderr_text
+
+    stdin_kwargs = {'input': input_bytes} if input_bytes is not None else {'stdin': subprocess.DEVNULL}
+    with open(log_path, 'ab') as log_f:
+        log_start = log_f.tell()
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=log_f,
+                                bufsize=FFMPEG_PIPE_BUFSIZE, **stdin_kwargs)
+    if result.returncode != 0:
+        with open(log_path, 'rb') as log_f:
+            log_f.seek(log_start)
+            stderr_text = log_f.read().decode('utf-8', errors='ignore')
+        raise subprocess.CalledProcessError(result.returncode, cmd, stderr=stderr_text)
+    return ""
+
+def _run_ffmpeg_with_progress(cmd: list[str], log_path: Path, progress: "Callable[[float], None]") -> None:
+    """以 -progress pipe:1 运行 FFmpeg：逐行解析 stdout 的 out_time_ms 并回调，stderr 追加写入 log_path。"""
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    with open(log_path, 'ab') as log_f:
+        log_start = log_f.tell()
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=log_f,
+                                text=True, encoding='utf-8', errors='ignore')
+        with proc.stdout:
+            for line in proc.stdout:
+                key, _, value = line.partition('=')
+                if key == 'out_time_ms': # 名字是 ms，单位实际是微秒 (各版本 FFmpeg 都会输出)
+                    try:
+                        progress(int(value) / 1_000_000)
+                    except ValueError:
+                        pass # 开始阶段为 N/A
+        returncode = proc.wait()
+    if returncode != 0:
+        with open(log_path, 'rb') as log_f:
+            log_f.seek(log_start)
+            stderr_text = log_f.read().decode('utf-8', errors='ignore')
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_text)
+
+def _run_ffmpeg_with_stderr_tail(cmd: list[str], input_bytes: bytes | None) -> tuple[int, str]:
+    """以管道读取 stderr，只保留末尾 FFMPEG_STDERR_TAIL_CHUNKS 块；返回 (返回码, stderr 末尾文本)。"""
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input_bytes is not None else subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=FFMPEG_PIPE_BUFSIZE
+    )
+    writer = None
+    if input_bytes is not None:
+        # 在线程中写 stdin，避免 stderr 管道写满时与 FFmpeg 互相等待
+        def _feed_stdin():
+            try:
+                proc.stdin.write(input_bytes)
+            except BrokenPipeError:
+                pass # FFmpeg 提前退出，返回码会反映错误
+            finally:
+                proc.stdin.close()
+        writer = threading.Thread(target=_feed_stdin, daemon=True)
+        writer.start()
+    tail = collections.deque(iter(lambda: proc.stderr.read1(8192), b""), maxlen=FFMPEG_STDERR_TAIL_CHUNKS)
+    proc.stderr.close()
+    returncode = proc.wait()
+    if writer is not None:
+        writer.join()
+    return returncode, b"".join(tail).decode('utf-8', errors='ignore')
+
 def create_video_segment(
-    image_path: Path,
+    image_path: "str | Image.Image",
     duration: float,
-    audio_path: Path | None,
     output_path: Path,
-    # width: int,
-    # fps: int
+    prepared: bool = False,
+    video_frames: int | None = None,
 ) -> bool:
+    """
+    将一张幻灯片图片编码为 Annex-B H.264 裸视频流片段 (output_path 通常以 .h264 结尾)。
+    音频由 encode_segment_audio 单独编码，之后两者按字节拼接 (见 concatenate_elementary_streams)。
+
+    image_path 可以是图片文件的绝对路径字符串，也可以是内存中的 PIL.Image / numpy 数组；
+    后者以 rawvideo (rgb24) 形式通过 stdin 管道送入 FFmpeg，省去 PNG 编解码和磁盘往返。
+
+    prepared 为 True 表示图片已是目标分辨率 (见 prepare_image)，滤镜链中省去逐帧缩放/填充。
+
+    帧数取 video_frames (由 elementary_frame_timeline 按累计时间轴算出)，未提供时按 duration 取整。
+    """
     # 使用 TARGET_WIDTH 和 TARGET_FPS 全局变量
     logging.info(f"  使用 FFmpeg 创建视频片段: {output_path.name} (目标时长: {duration:.3f}s)")
 
@@ -282,153 +715,190 @@ def create_video_segment(
          logging.error("FFmpeg 路径未解析，无法创建视频片段。")
          return False
 
-    temp_video_path = output_path.with_suffix(".temp_video.mp4") # 临时的无声视频文件
-    step1_success = False
-    step2_success = False
-
-    # --- 步骤 1: 图片转为无声视频 ---
-    # 使用 -t 参数设置准确的时长
-    cmd_step1 = [
-        FFMPEG_PATH_RESOLVED, "-y", # 使用解析后的路径
-        "-loop", "1", "-framerate", str(TARGET_FPS),
-        "-i", str(image_path.resolve()),
+    # --- 单次 FFmpeg 调用: 图片直接编码为裸视频流，用 -frames:v 精确控制帧数 ---
+    hw: str | None = detect_hw_encoder()
+    raw_frame: bytes | None = None # 内存图片时通过 stdin 写入的 rgb24 数据
+    cmd: list[str] = [FFMPEG_PATH_RESOLVED, "-y", *encoder_global_args(hw)] # 使用解析后的路径
+    vf_prefix = ""
+    if isinstance(image_path, str):
+        cmd += ["-loop", "1", "-framerate", str(TARGET_FPS), "-i", image_path]
+    else:
+        frame = image_path if isinstance(image_path, Image.Image) else Image.fromarray(image_path)
+        frame = frame.convert('RGB')
+        raw_frame = frame.tobytes()
+        cmd += [
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{frame.width}x{frame.height}", "-framerate", str(TARGET_FPS),
+            "-i", "pipe:0",
+        ]
+        vf_prefix = "loop=loop=-1:size=1:start=0," # 单帧循环，时长由输出端 -frames:v 控制
+    cmd += [
         # 保持视频滤镜不变 (缩放/填充/帧率/像素格式)
-        "-vf", f"scale={TARGET_WIDTH}:-2:force_original_aspect_ratio=decrease,pad={TARGET_WIDTH}:{TARGET_WIDTH*9//16}:(ow-iw)/2:(oh-ih)/2,format=yuv420p,fps={TARGET_FPS}",
-        # !!! 关键: 使用传入的 duration !!!
-        "-t", f"{duration:.3f}", # 格式化为小数点后3位
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
-        "-pix_fmt", "yuv420p", "-an", str(temp_video_path.resolve())
+        "-vf", vf_prefix + (_VF_PREPARED if prepared else _VF_STANDARD) + video_filter_suffix(hw),
+        *video_encoder_args(hw, "veryfast", 23),
+        "-threads", str(SEGMENT_FFMPEG_THREADS), # 片段并行编码，单进程限制线程数
     ]
+    if video_frames is None:
+        video_frames = max(1, round(duration * TARGET_FPS))
+    if hw is not None: # 裸码流按字节拼接要求没有 B 帧 (libx264 已由 X264_SLIDE_PARAMS 关闭)
+        cmd += ["-bf", "0"]
+    cmd += [
+        "-an", "-frames:v", str(video_frames),
+        "-bsf:v", "h264_mp4toannexb", "-f", "h264", os.fspath(output_path),
+    ]
+
     try:
-        logging.debug(f"    执行 FFmpeg 命令 (步骤 1 - 图片转无声视频): {shlex.join(cmd_step1)}") # 使用 shlex.join
-        result1 = subprocess.run(cmd_step1, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-        if result1.stderr: logging.debug(f"    FFmpeg (step1) stderr:\n{result1.stderr}")
-        logging.info(f"    步骤 1 成功: 已生成无声视频 {temp_video_path.name}")
-        step1_success = True
+        logging.debug(f"    执行 FFmpeg 命令 (图片 -> 视频片段): {shlex.join(cmd)}") # 使用 shlex.join
+        # 内存图片时通过管道写入原始帧
+        # 片段并行编码，每个片段单独的日志文件，避免失败时读回其他进程的输出
+        stderr_text = run_ffmpeg(cmd, output_path.parent / f"{output_path.name}.log", input_bytes=raw_frame)
+        if stderr_text: logging.debug(f"    FFmpeg (segment) stderr:\n{stderr_text}")
+        logging.info(f"    视频片段生成成功: {output_path.name}")
+        return True
     except subprocess.CalledProcessError as e:
-        logging.error(f"  FFmpeg 创建无声视频失败: {temp_video_path.name}。返回码: {e.returncode}")
-        logging.error(f"  FFmpeg 命令: {shlex.join(cmd_step1)}")
+        logging.error(f"  FFmpeg 创建视频片段失败: {output_path.name}。返回码: {e.returncode}")
+        logging.error(f"  FFmpeg 命令: {shlex.join(cmd)}")
         logging.error(f"  FFmpeg 标准错误输出:\n{e.stderr}")
-        if temp_video_path.exists():
-             try: temp_video_path.unlink()
-             except OSError: pass
+        output_path.unlink(missing_ok=True)
         return False
     except FileNotFoundError:
         logging.error(f"错误：找不到 FFmpeg 命令 '{FFMPEG_PATH_RESOLVED}'。")
         return False
     except Exception as e:
-        logging.error(f"  创建无声视频时发生未知错误 {temp_video_path.name}: {e}")
+        logging.error(f"  创建视频片段时发生未知错误 {output_path.name}: {e}")
         return False
 
-    # --- 步骤 2: 合并无声视频和音频 (如果音频存在且有效) ---
-    if step1_success:
-        # 检查 audio_path 是否有效，并且对应的目标时长大于一个很小的值
-        if audio_path and audio_path.is_file() and audio_path.stat().st_size > 100 and duration > 0.01:
-            logging.info(f"    步骤 2: 合并视频与音频 {audio_path.name} 到 {output_path.name}")
-            cmd_step2 = [
-                FFMPEG_PATH_RESOLVED, "-y", # 使用解析后的路径
-                "-i", str(temp_video_path.resolve()),
-                "-i", str(audio_path.resolve()),
-                "-c:v", "copy",
-                "-c:a", "aac", # 转为 AAC
-                "-b:a", "128k",
-                # 使用 -shortest 确保输出时长以最短输入为准，理论上视频和音频应该匹配了
-                "-shortest",
-                str(output_path.resolve())
-            ]
-            try:
-                logging.debug(f"    执行 FFmpeg 命令 (步骤 2 - 合并音视频): {shlex.join(cmd_step2)}") # 使用 shlex.join
-                result2 = subprocess.run(cmd_step2, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-                if result2.stderr: logging.debug(f"    FFmpeg (step2) stderr:\n{result2.stderr}")
-                logging.info(f"    步骤 2 成功: 已合并音视频到 {output_path.name}")
-                step2_success = True
-            except subprocess.CalledProcessError as e:
-                logging.error(f"  FFmpeg 合并音视频失败: {output_path.name}。返回码: {e.returncode}")
-                logging.error(f"  FFmpeg 命令: {shlex.join(cmd_step2)}")
-                logging.error(f"  FFmpeg 标准错误输出:\n{e.stderr}")
-                step2_success = False
-            except FileNotFoundError:
-                 logging.error(f"错误：找不到 FFmpeg 命令 '{FFMPEG_PATH_RESOLVED}'。")
-                 step2_success = False
-            except Exception as e:
-                 logging.error(f"  合并音视频时发生未知错误 {output_path.name}: {e}")
-                 step2_success = False
-            finally:
-                 if temp_video_path.exists():
-                     try: temp_video_path.unlink()
-                     except OSError: pass
-        else:
-            # 如果没有音频或音频时长无效，直接重命名无声视频
-            logging.info(f"    步骤 2: 无有效音频或时长过短，直接使用无声视频 {temp_video_path.name} 作为输出 {output_path.name}")
-            try:
-                shutil.move(str(temp_video_path.resolve()), str(output_path.resolve()))
-                step2_success = True
-            except Exception as e:
-                 logging.error(f"    重命名无声视频失败: {e}")
-                 step2_success = False
-                 if temp_video_path.exists():
-                      try: temp_video_path.unlink()
-                      except OSError: pass
 
-    return step1_success and step2_success
+def elementary_frame_timeline(segment_plan: "Iterable[dict]") -> "Iterator[tuple[dict, int, int]]":
+    """
+    逐个产出 (片段, 视频帧数, AAC 帧数)，供裸码流拼接使用 (segment_plan 可以是生成器)。
+
+    裸码流没有容器时间戳，拼接后的时间轴完全由帧数/采样数决定。帧数不按片段各自取整 (误差会逐段累加)，
+    而是由取整后的累计时间轴相减得出：视频结束帧 = round(累计时长 * FPS)，音频结束帧对齐到该视频时刻。
+    因此任意片段结束处音视频相差不超过半个 AAC 帧，不随片段数漂移。
+    每个片段至少 1 个视频帧、2 个 AAC 帧 (见 encode_segment_audio)，极短片段之后的时间轴会自动追平。
+    """
+    elapsed = 0.0
+    video_total = aac_total = 0
+    for seg in segment_plan:
+        elapsed += seg['duration']
+        video_end = max(video_total + 1, round(elapsed * TARGET_FPS))
+        aac_end = max(aac_total + 2, round(video_end / TARGET_FPS * AAC_SAMPLE_RATE / AAC_FRAME_SAMPLES))
+        yield seg, video_end - video_total, aac_end - aac_total
+        video_total, aac_total = video_end, aac_end
 
 
-def concatenate_videos(video_file_list_path: Path, output_path: Path) -> bool:
-    """使用 FFmpeg concat demuxer 拼接视频文件。"""
-    logging.info(f"使用 FFmpeg concat demuxer 拼接视频...")
+def encode_segment_audio(audio_path: str | None, aac_frames: int, output_path: Path) -> bool:
+    """
+    将一个片段的音频编码为 ADTS AAC 裸流 (无音频时编码等长静音)，长度为 aac_frames 个 AAC 帧
+    (与同一片段的视频帧数对齐，见 elementary_frame_timeline)。
+
+    AAC 编码器会在开头多输出一帧预填充 (priming)，所以只编码 n-1 帧的采样，解码后正好是 n 帧。
+    """
+    has_audio = bool(audio_path and regular_file_size(audio_path) > 100)
+    cmd = [FFMPEG_PATH_RESOLVED, "-y"]
+    if has_audio:
+        cmd += ["-i", audio_path]
+    else:
+        cmd += ["-f", "lavfi", "-i", f"anullsrc=r={AAC_SAMPLE_RATE}:cl=stereo"]
+    cmd += [
+        "-vn", "-af", f"apad,atrim=end_sample={(aac_frames - 1) * AAC_FRAME_SAMPLES}",
+        "-ar", str(AAC_SAMPLE_RATE), "-ac", "2", "-c:a", "aac", "-b:a", "128k",
+        "-f", "adts", os.fspath(output_path),
+    ]
+    try:
+        logging.debug(f"    执行 FFmpeg 命令 (音频 -> AAC): {shlex.join(cmd)}")
+        run_ffmpeg(cmd, output_path.parent / f"{output_path.name}.log")
+        return True
+    except subprocess.CalledProcessError as e:
+        logging.error(f"  FFmpeg 编码片段音频失败: {output_path.name}。返回码: {e.returncode}")
+        logging.error(f"  FFmpeg 标准错误输出:\n{e.stderr}")
+        output_path.unlink(missing_ok=True)
+        return False
+    except OSError as e:
+        logging.error(f"  编码片段音频时出错 {output_path.name}: {e}")
+        return False
+
+# 只有 Linux 的 sendfile 能写入普通文件 (macOS 的 sendfile 只能写 socket)，与 shutil 的判断一致
+_SENDFILE_TO_FILE = hasattr(os, 'sendfile') and sys.platform.startswith('linux')
+
+def _join_files(sources: list[Path], destination: Path) -> None:
+    """按顺序把多个文件的字节拼接到 destination；Linux 上用 os.sendfile 在内核中直接复制。"""
+    with open(destination, 'wb') as dst:
+        for source in sources:
+            with open(source, 'rb') as src:
+                offset = 0
+                if _SENDFILE_TO_FILE:
+                    size = os.fstat(src.fileno()).st_size
+                    dst.flush() # sendfile 直接写文件描述符，先写出缓冲区中之前的内容
+                    try:
+                        while offset < size:
+                            sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                            if sent == 0:
+                                break
+                            offset += sent
+                        continue
+                    except OSError: # 文件系统不支持等情况：从已复制的位置改用普通读写
+                        dst.seek(0, os.SEEK_END)
+                src.seek(offset)
+                shutil.copyfileobj(src, dst, FFMPEG_PIPE_BUFSIZE)
+
+
+def concatenate_elementary_streams(segment_files: list[Path], output_path: Path) -> bool:
+    """
+    拼接 create_video_segment 输出的裸码流片段 (.h264 + 同名 .aac)。
+
+    Annex-B H.264 和 ADTS AAC 都可以直接按字节首尾相接，所以先用 _join_files 拼接，
+    再用一次 FFmpeg -c copy 封装成 MP4，不经过逐片段的解复用/重封装。
+    """
+    logging.info(f"按字节拼接 {len(segment_files)} 个裸码流片段...")
+    joined_video = output_path.with_suffix(".h264")
+    joined_audio = output_path.with_suffix(".aac")
     cmd_list = [
-        FFMPEG_PATH,
-        "-f", "concat",
-        "-safe", "0", # 允许绝对路径
-        "-i", str(video_file_list_path.resolve()),
-        "-c", "copy", # 直接复制代码流，速度快，不重新编码
-        str(output_path.resolve())
+        FFMPEG_PATH_RESOLVED, "-y",
+        "-fflags", "+genpts", "-f", "h264", "-framerate", str(TARGET_FPS), "-i", os.fspath(joined_video),
+        "-f", "aac", "-i", os.fspath(joined_audio),
+        "-map", "0:v", "-map", "1:a",
+        "-c", "copy", "-bsf:a", "aac_adtstoasc",
+        *MP4_FASTSTART_ARGS,
+        os.fspath(output_path)
     ]
     try:
-        logging.debug(f"  执行 FFmpeg 命令: {' '.join(shlex.quote(c) for c in cmd_list)}")
-        result = subprocess.run(cmd_list, capture_output=True, text=True, check=True, encoding='utf-8')
-        if result.stderr: logging.debug(f"  FFmpeg (concat) stderr:\n{result.stderr}")
+        _join_files(segment_files, joined_video)
+        _join_files([f.with_suffix(".aac") for f in segment_files], joined_audio)
+        logging.debug(f"  执行 FFmpeg 命令: {shlex.join(cmd_list)}")
+        stderr_text = run_ffmpeg(cmd_list, output_path.parent / "ffmpeg.log")
+        if stderr_text: logging.debug(f"  FFmpeg (mux) stderr:\n{stderr_text}")
         logging.info(f"视频拼接成功: {output_path.name}")
         return True
     except subprocess.CalledProcessError as e:
-        logging.error(f"FFmpeg 拼接视频失败。返回码: {e.returncode}")
-        logging.error(f"FFmpeg 命令: {' '.join(shlex.quote(c) for c in cmd_list)}")
+        logging.error(f"FFmpeg 封装拼接后的码流失败。返回码: {e.returncode}")
+        logging.error(f"FFmpeg 命令: {shlex.join(cmd_list)}")
         logging.error(f"FFmpeg 错误输出:\n{e.stderr}")
         return False
-    except FileNotFoundError:
-         logging.error(f"错误：找不到 '{FFMPEG_PATH}' 命令。")
-         return False
-    except Exception as e:
-         logging.error(f"拼接视频时发生未知错误: {e}")
-         return False
-
+    except OSError as e:
+        logging.error(f"拼接裸码流片段时出错: {e}")
+        return False
+    finally:
+        joined_video.unlink(missing_ok=True)
+        joined_audio.unlink(missing_ok=True)
 
-import shlex # 确保导入 shlex
 
-def add_subtitles(input_video: Path, srt_file: Path, output_video: Path) -> bool:
+def build_subtitles_filter(srt_file: Path) -> str:
     """
-    使用 FFmpeg 将 SRT 字幕硬编码到视频中。
-    应用来自 config.ini 的样式。
+    构建 FFmpeg subtitles 滤镜字符串，应用来自 config.ini 的样式。
 
     Args:
-        input_video: 输入视频文件的 Path 对象。
         srt_file: SRT 字幕文件的 Path 对象。
-        output_video: 输出视频文件的 Path 对象。
 
     Returns:
-        bool: 字幕添加成功返回 True，否则返回 False。
+        str: 形如 subtitles='...':force_style='...' 的滤镜描述。
     """
-    logging.info(f"使用 FFmpeg 添加字幕到视频...")
-
-    if FFMPEG_PATH_RESOLVED is None:
-         logging.error("FFmpeg 路径未解析，无法添加字幕。")
-         return False
-
     # --- 获取字幕样式配置 ---
     # 优先使用 config.ini 中的设置
-    # 'Video' section, 'subtitle_style_ffmpeg' key
+    # [视频设置] section, 'subtitle_style_ffmpeg' key
     ffmpeg_style_str = config.get(
-        'Video',
+        VIDEO_SECTION,
         'subtitle_style_ffmpeg', # 使用新 Key 名，更明确
         fallback="Fontsize=18,PrimaryColour=&H00FFFFFF,BackColour=&H9A000000,BorderStyle=1,Outline=1,Shadow=0.8,Alignment=2,MarginV=25" # 提供一个更合适的默认值
     )
@@ -436,35 +906,78 @@ def add_subtitles(input_video: Path, srt_file: Path, output_video: Path) -> bool
 
     # --- 准备 FFmpeg filtergraph ---
     # 正确转义 SRT 文件路径给 FFmpeg filter
-    srt_path_str = str(srt_file.resolve())
+    # as_posix() 在所有平台上都输出正斜杠，FFmpeg 均可识别，无需再替换反斜杠
+    srt_path_escaped_for_filter = srt_file.as_posix().replace("'", r"\'") # 基本转义
     if platform.system() == "Windows":
-         # Windows 路径转义: \ -> /, : -> \:
-         srt_path_escaped_for_filter = srt_path_str.replace('\\', '/').replace(':', r'\:')
-    else:
-         # Linux/macOS 通常只需要处理特殊字符，但这里简单处理
-         srt_path_escaped_for_filter = srt_path_str.replace("'", r"\'") # 基本转义
+         srt_path_escaped_for_filter = srt_path_escaped_for_filter.replace(':', r'\:') # 盘符冒号: C: -> C\:
 
     # 构建 filtergraph，应用 force_style
-    vf_filter = f"subtitles='{srt_path_escaped_for_filter}':force_style='{ffmpeg_style_str}'"
+    return f"subtitles='{srt_path_escaped_for_filter}':force_style='{ffmpeg_style_str}'"
+
+
+def add_subtitles(
+    input_video: Path,
+    srt_file: Path,
+    output_video: Path,
+    progress: "Callable[[float], None] | None" = None,
+    duration: float = 0.0
+) -> bool:
+    """
+    使用 FFmpeg 将 SRT 字幕硬编码到视频中。
+    应用来自 config.ini 的样式。hardcode_subtitles = False 时改为封装软字幕轨道，不重新编码。
 
-    input_video_str = str(input_video.resolve())
-    output_video_str = str(output_video.resolve())
+    Args:
+        input_video: 输入视频文件的 Path 对象。
+        srt_file: SRT 字幕文件的 Path 对象。
+        output_video: 输出视频文件的 Path 对象。
+        progress: (可选) 进度回调，参数为 0~1；需要同时提供视频总时长 duration (秒)。
+        duration: 输入视频的总时长 (秒)，用于计算进度。
+
+    Returns:
+        bool: 字幕添加成功返回 True，否则返回 False。
+    """
+    logging.info(f"使用 FFmpeg 添加字幕到视频...")
+
+    if FFMPEG_PATH_RESOLVED is None:
+         logging.error("FFmpeg 路径未解析，无法添加字幕。")
+         return False
+
+    input_video_str = os.fspath(input_video)
+    output_video_str = os.fspath(output_video)
 
     # --- 构建 FFmpeg 命令 ---
-    cmd_list = [
-        FFMPEG_PATH_RESOLVED, "-y", # 使用解析后的路径，允许覆盖
-        "-i", input_video_str,
-        "-vf", vf_filter,
-        "-c:v", "libx264",
-        "-preset", "medium", # 平衡速度和质量
-        "-crf", "22",       # 调整视频质量
-        "-c:a", "copy",     # 直接复制音频流
-        output_video_str
-    ]
+    if not HARDCODE_SUBTITLES:
+        # 软字幕：音视频直接复制，只把 SRT 转为 MP4 的 mov_text 轨道
+        cmd_list = [
+            FFMPEG_PATH_RESOLVED, "-y",
+            "-i", input_video_str,
+            "-i", os.fspath(srt_file),
+            "-map", "0", "-map", "1",
+            "-c", "copy", "-c:s", "mov_text",
+            "-metadata:s:s:0", f"language={SUBTITLE_LANGUAGE}",
+            *MP4_FASTSTART_ARGS,
+            output_video_str
+        ]
+    else:
+        vf_filter = build_subtitles_filter(srt_file)
+        hw = detect_hw_encoder()
+        cmd_list = [
+            FFMPEG_PATH_RESOLVED, "-y", # 使用解析后的路径，允许覆盖
+            *encoder_global_args(hw),
+            "-i", input_video_str,
+            "-vf", vf_filter + video_filter_suffix(hw),
+            *video_encoder_args(hw, "medium", 22), # medium: 平衡速度和质量; crf 22: 视频质量
+            "-c:a", "copy",     # 直接复制音频流
+            *MP4_FASTSTART_ARGS,
+            output_video_str
+        ]
     try:
         logging.debug(f"  执行 FFmpeg 命令 (添加字幕): {shlex.join(cmd_list)}")
-        result = subprocess.run(cmd_list, capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-        if result.stderr: logging.debug(f"  FFmpeg (subtitles) stderr:\n{result.stderr}")
+        on_time = None
+        if progress is not None and duration > 0:
+            on_time = lambda seconds: progress(min(1.0, seconds / duration))
+        stderr_text = run_ffmpeg(cmd_list, output_video.parent / "ffmpeg.log", progress=on_time)
+        if stderr_text: logging.debug(f"  FFmpeg (subtitles) stderr:\n{stderr_text}")
         logging.info(f"字幕添加成功: {output_video.name}")
         return True
     except subprocess.CalledProcessError as e:
@@ -479,149 +992,374 @@ def add_subtitles(input_video: Path, srt_file: Path, output_video: Path) -> bool
          logging.error(f"添加字幕时发生未知错误: {e}")
          return False
 
-# --- 视频合成主函数 (重写) ---
-def create_video_from_data(
-    processed_data: list[dict],
-    temp_run_dir: Path,
-    output_video_path: Path
-) -> bool:
+FILTERGRAPH_INLINE_LIMIT = 8000 # filtergraph 超过该长度 (字符) 时写入脚本文件
+
+def build_single_pass_command(
+    segment_plan: list[dict],
+    srt_file: Path | None,
+    output_path: Path,
+    script_dir: Path | None = None
+) -> list[str]:
     """
-    根据处理好的数据，使用 FFmpeg 合成最终视频 (无转场)。
-    确保使用正确的音频时长，并应用字幕样式。
+    构建单次合成的 FFmpeg 命令：N 个图片/音频输入 -> 缩放/填充 -> concat -> (字幕) -> 一次 libx264 编码。
 
     Args:
-        processed_data: 字典列表，包含幻灯片信息。
-        temp_run_dir: 临时工作目录。
-        output_video_path: 最终视频输出路径。
+        segment_plan: 片段列表，每项包含 'image_path' (绝对路径 str)、'duration' (float)、'audio_path' (绝对路径 str | None)。
+        srt_file: 要烧录的 SRT 字幕文件，None 表示不加字幕。
+        output_path: 输出视频路径。
+        script_dir: (可选) filtergraph 过长时写入 -filter_complex_script 文件的目录。
+    """
+    inputs = []
+    filters = []
+    concat_pads = []
+    input_index = 0
+    for i, seg in enumerate(segment_plan):
+        duration_str = f"{seg['duration']:.3f}"
+        inputs += ["-loop", "1", "-framerate", str(TARGET_FPS), "-t", duration_str, "-i", seg['image_path']]
+        filters.append(f"[{input_index}:v]{_VF_PREPARED if seg.get('prepared') else _VF_STANDARD}[v{i}]")
+        input_index += 1
+        if seg['audio_path']:
+            inputs += ["-i", seg['audio_path']]
+            # 补齐/截断到片段时长，保证音画对齐
+            filters.append(
+                f"[{input_index}:a]aformat=sample_rates=44100:channel_layouts=stereo,"
+                f"apad,atrim=0:{duration_str},asetpts=PTS-STARTPTS[a{i}]"
+            )
+            input_index += 1
+        else:
+            # 无音频的幻灯片使用静音填充
+            filters.append(f"anullsrc=r=44100:cl=stereo,atrim=0:{duration_str},asetpts=PTS-STARTPTS[a{i}]")
+        concat_pads.append(f"[v{i}][a{i}]")
+
+    video_label = "[vc]"
+    filters.append(f"{''.join(concat_pads)}concat=n={len(segment_plan)}:v=1:a=1{video_label}[ac]")
+    if srt_file is not None:
+        filters.append(f"{video_label}{build_subtitles_filter(srt_file)}[vout]")
+        video_label = "[vout]"
+    hw = detect_hw_encoder()
+    if video_filter_suffix(hw):
+        filters.append(f"{video_label}{video_filter_suffix(hw).lstrip(',')}[vhw]")
+        video_label = "[vhw]"
+
+    filtergraph = ";".join(filters)
+    if script_dir is not None and len(filtergraph) > FILTERGRAPH_INLINE_LIMIT:
+        # 幻灯片很多时 filtergraph 可能超出命令行长度限制 (Windows 约 32K 字符)，改为从文件读取
+        script_path = script_dir / "single_pass_filtergraph.txt"
+        script_path.write_text(filtergraph, encoding='utf-8')
+        filter_args = ["-filter_complex_script", os.fspath(script_path)]
+    else:
+        filter_args = ["-filter_complex", filtergraph]
+
+    return [
+        FFMPEG_PATH_RESOLVED, "-y",
+        *encoder_global_args(hw),
+        *inputs,
+        *filter_args,
+        "-map", video_label, "-map", "[ac]",
+        *video_encoder_args(hw, "medium", 22),
+        "-c:a", "aac", "-b:a", "128k",
+        *MP4_FASTSTART_ARGS,
+        os.fspath(output_path)
+    ]
 
-    Returns:
-        bool: 成功返回 True，失败返回 False。
+
+def render_video_single_pass(
+    segment_plan: list[dict],
+    srt_file: Path | None,
+    output_path: Path,
+    log_path: Path,
+    progress: "Callable[[float], None] | None" = None
+) -> bool:
+    """使用单个 FFmpeg filtergraph 完成片段缩放、拼接和字幕烧录，只编码一次。progress 回调编码进度 (0~1)。"""
+    logging.info(f"使用单次 FFmpeg 调用合成 {len(segment_plan)} 个片段{' (含字幕)' if srt_file else ''}...")
+    cmd_list = build_single_pass_command(segment_plan, srt_file, output_path, script_dir=log_path.parent)
+    total_duration = sum(seg['duration'] for seg in segment_plan)
+    on_time = None
+    if progress is not None and total_duration > 0:
+        on_time = lambda seconds: progress(min(1.0, seconds / total_duration))
+    try:
+        logging.debug(f"  执行 FFmpeg 命令 (单次合成): {shlex.join(cmd_list)}")
+        stderr_text = run_ffmpeg(cmd_list, log_path, progress=on_time)
+        if stderr_text: logging.debug(f"  FFmpeg (single pass) stderr:\n{stderr_text}")
+        logging.info(f"单次合成成功: {output_path.name}")
+        return True
+    except subprocess.CalledProcessError as e:
+        logging.error(f"FFmpeg 单次合成失败。返回码: {e.returncode}")
+        logging.error(f"FFmpeg 命令: {shlex.join(cmd_list)}")
+        logging.error(f"FFmpeg 标准错误输出:\n{e.stderr}")
+    except FileNotFoundError:
+        logging.error(f"错误：找不到 FFmpeg 命令 '{FFMPEG_PATH_RESOLVED}'。")
+    except Exception as e:
+        logging.error(f"单次合成时发生未知错误: {e}")
+    try: output_path.unlink(missing_ok=True)
+    except OSError: pass
+    return False
+
+
+def letterbox_image(image: Image.Image) -> Image.Image:
+    """将图片等比缩放并用黑边填充到 TARGET_WIDTH x (TARGET_WIDTH*9/16)。"""
+    target_size = (TARGET_WIDTH, TARGET_WIDTH * 9 // 16)
+    return ImageOps.pad(image.convert('RGB'), target_size, color='black')
+
+
+def prepare_image(src_path: str, dst_path: Path) -> str:
     """
-    logging.info("--- 开始基于 FFmpeg 的视频合成流程 ---")
-    if not processed_data:
-        logging.error("输入数据为空，无法合成视频。")
-        return False
-    if FFMPEG_PATH_RESOLVED is None:
-         logging.error("FFmpeg 路径未设置，无法合成视频。")
-         return False
+    把幻灯片图片一次性缩放/填充到目标分辨率 (RGB)，返回供 FFmpeg 使用的路径。
 
-    temp_segments_dir = temp_run_dir / "video_segments"
-    temp_segments_dir.mkdir(exist_ok=True)
-    segment_files = []
-
-    # --- 1. 生成各幻灯片的视频片段 ---
-    logging.info("步骤 1: 使用 FFmpeg 生成各幻灯片的视频片段")
-    for i, data in enumerate(processed_data):
-        slide_num = data.get('slide_number', i + 1)
-        image_path_str = data.get('image_path')
-        audio_path_str = data.get('audio_path')
-        # !!! 关键: 获取准确的时长 !!!
-        duration = data.get('audio_duration') # 从传入数据获取
-
-        if not image_path_str or not Path(image_path_str).is_file():
-            logging.warning(f"幻灯片 {slide_num}: 图片路径无效或丢失。跳过此片段。")
-            continue
+    图片已经是目标尺寸的 RGB 图时直接返回原路径 (只读取文件头)。
+    """
+    with Image.open(src_path) as image:
+        if image.size == (TARGET_WIDTH, TARGET_WIDTH * 9 // 16) and image.mode == 'RGB':
+            return src_path
+        letterbox_image(image).save(dst_path) # BMP：无损且无需压缩
+    return str(dst_path)
 
-        image_path = Path(image_path_str)
-        audio_path = Path(audio_path_str) if audio_path_str and Path(audio_path_str).is_file() else None
 
-        # --- 确定片段时长 ---
-        clip_duration = 0.0
-        if duration is not None and duration > 0.01: # 检查时长是否有效 (>0.01s)
-            clip_duration = duration
-            logging.debug(f"幻灯片 {slide_num}: 使用音频时长 {clip_duration:.3f}s")
-        else:
-            # 如果 duration 无效 (None, 0, 或太小)，使用默认时长
-            clip_duration = DEFAULT_SLIDE_DURATION
-            if audio_path:
-                logging.warning(f"幻灯片 {slide_num}: 音频时长无效或过短({duration}), 使用默认展示时长 {clip_duration}s")
-            else:
-                logging.info(f"幻灯片 {slide_num}: 无音频，使用默认展示时长 {clip_duration}s")
-        # --- ----------------- ---
+def _prepare_segment_image(seg: dict, dst_dir: Path, idx: int) -> None:
+    """
+    把一个片段的图片缩放/填充到目标分辨率，就地更新 'image_path' 并设置 'prepared'。
+    图片文件输出为 dst_dir/prepared_{idx}.bmp；内存中的图片直接在内存中处理。
+    处理失败时保留原图，由 FFmpeg 滤镜链负责缩放。
+    """
+    image = seg['image_path']
+    if isinstance(image, str):
+        try:
+            seg['image_path'] = prepare_image(image, dst_dir / f"prepared_{idx}.bmp")
+        except Exception as e:
+            logging.warning(f"预处理图片失败，改由 FFmpeg 缩放: {image}: {e}")
+            return
+    else:
+        frame = image if isinstance(image, Image.Image) else Image.fromarray(image)
+        seg['image_path'] = letterbox_image(frame)
+    seg['prepared'] = True
 
-        segment_output_path = temp_segments_dir / f"segment_{slide_num}.mp4"
 
-        success = create_video_segment(
-            image_path,
-            clip_duration, # <<< 传递最终确定的时长
-            audio_path if clip_duration == duration else None, # 如果用了默认时长，则不合并音频
-            segment_output_path,
-            # TARGET_WIDTH 和 TARGET_FPS 从全局配置读取，无需传递
-        )
-        if success:
-            segment_files.append(segment_output_path)
+def prepare_slide_images(segment_plan: list[dict], prepared_dir: Path) -> None:
+    """
+    预处理 segment_plan 中的全部图片 (相同路径只处理一次)，就地更新 'image_path' 并设置 'prepared'。
+    单张图片处理失败时保留原图，由 FFmpeg 滤镜链负责缩放。
+    """
+    prepared_dir.mkdir(exist_ok=True)
+    first_by_path: dict[str, dict] = {} # 原图片路径 -> 第一个使用它的片段
+    for i, seg in enumerate(segment_plan):
+        if isinstance(seg['image_path'], str):
+            first_by_path.setdefault(seg['image_path'], seg)
         else:
-            logging.error(f"未能创建幻灯片 {slide_num} 的视频片段。合成中止。")
-            return False
+            _prepare_segment_image(seg, prepared_dir, i)
+    duplicates = [(seg, first_by_path[seg['image_path']]) for seg in segment_plan
+                  if isinstance(seg['image_path'], str) and first_by_path[seg['image_path']] is not seg]
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool: # Pillow 解码/缩放时释放 GIL
+        list(pool.map(lambda item: _prepare_segment_image(item[1], prepared_dir, item[0]),
+                      enumerate(first_by_path.values())))
+
+    for seg, first in duplicates: # 相同图片的其余片段复用第一个片段的结果
+        seg['image_path'] = first['image_path']
+        seg['prepared'] = first.get('prepared', False)
 
-    if not segment_files:
-        logging.error("未能成功生成任何视频片段。")
-        return False
 
-    # --- 2. 拼接视频片段 (保持不变) ---
-    logging.info("步骤 2: 使用 FFmpeg 拼接视频片段")
-    concat_list_file = temp_run_dir / "video_concat_list.txt"
+def _resampled_audio_frames(audio_in, resampler):
+    """逐帧解码 audio_in 的第一条音轨并重采样；解码结束后刷新 resampler，取出其内部缓存的尾部采样。"""
+    for decoded in audio_in.decode(audio=0):
+        yield from resampler.resample(decoded)
+    yield from resampler.resample(None)
+
+
+def render_video_pyav(segment_plan: list[dict], output_path: Path) -> bool:
+    """
+    使用 PyAV 在进程内合成整段视频 (无字幕)。
+
+    所有幻灯片共用一个 H.264 编码器和一个 AAC 编码器，不启动子进程、不写中间文件。
+    每张幻灯片的音频被截断/补静音到片段时长，保证音画对齐。
+    """
+    from fractions import Fraction
+
+    sample_rate = 44100
+    logging.info(f"使用 PyAV 合成 {len(segment_plan)} 个片段...")
+    container = None
     try:
-        with open(concat_list_file, 'w', encoding='utf-8') as f:
-            for segment_file in segment_files:
-                safe_path = str(segment_file.resolve()).replace('\\', '/')
-                f.write(f"file '{safe_path}'\n")
+        container = av.open(str(output_path), mode='w', options={'movflags': 'faststart'})
+        vstream = container.add_stream('libx264', rate=TARGET_FPS)
+        vstream.width = TARGET_WIDTH
+        vstream.height = TARGET_WIDTH * 9 // 16
+        vstream.pix_fmt = 'yuv420p'
+        vstream.options = {'preset': 'veryfast', 'crf': '23', 'tune': 'stillimage', 'x264-params': X264_SLIDE_PARAMS}
+        astream = container.add_stream('aac', rate=sample_rate)
+        astream.codec_context.layout = 'stereo'
+
+        video_pts = 0
+        audio_pts = 0
+        elapsed = 0.0
+        for seg in segment_plan:
+            image = seg['image_path']
+            if isinstance(image, str):
+                with Image.open(image) as img:
+                    image = letterbox_image(img)
+            else:
+                image = letterbox_image(image if isinstance(image, Image.Image) else Image.fromarray(image))
+            frame = av.VideoFrame.from_image(image).reformat(format='yuv420p')
+            # 帧数/采样数由取整后的累计时间轴相减得出，误差不随片段数累积 (同 elementary_frame_timeline)
+            elapsed += seg['duration']
+            video_end = max(video_pts + 1, round(elapsed * TARGET_FPS))
+            for _ in range(video_end - video_pts):
+                frame.pts = video_pts
+                frame.time_base = Fraction(1, TARGET_FPS)
+                container.mux(vstream.encode(frame))
+                video_pts += 1
+
+            # 音频: 解码 -> 重采样 -> 截断到片段时长，不足部分补静音
+            target_samples = round(video_end * sample_rate / TARGET_FPS) - audio_pts # 对齐到视频时间轴
+            written = 0
+            if seg['audio_path']:
+                resampler = av.AudioResampler(format='fltp', layout='stereo', rate=sample_rate) # 每个片段单独刷新
+                with av.open(seg['audio_path']) as audio_in:
+                    for resampled in _resampled_audio_frames(audio_in, resampler):
+                        remaining = target_samples - written
+                        if resampled.samples > remaining: # 越过片段末尾的帧截断到剩余采样数
+                            trimmed = av.AudioFrame.from_ndarray(
+                                resampled.to_ndarray()[:, :remaining], format='fltp', layout='stereo'
+                            )
+                            trimmed.sample_rate = sample_rate
+                            resampled = trimmed
+                        resampled.pts = audio_pts + written
+                        resampled.time_base = Fraction(1, sample_rate)
+                        container.mux(astream.encode(resampled))
+                        written += resampled.samples
+                        if written >= target_samples: # 片段音频已满，停止解码该片段
+                            break
+            if target_samples > written:
+                silence = av.AudioFrame(format='fltp', layout='stereo', samples=target_samples - written)
+                for plane in silence.planes:
+                    plane.update(bytes(plane.buffer_size))
+                silence.sample_rate = sample_rate
+                silence.pts = audio_pts + written
+                silence.time_base = Fraction(1, sample_rate)
+                container.mux(astream.encode(silence))
+            audio_pts += target_samples
+
+        # 刷新编码器缓冲
+        container.mux(vstream.encode(None))
+        container.mux(astream.encode(None))
+        container.close()
+        container = None
+        logging.info(f"PyAV 合成成功: {output_path.name}")
+        return True
     except Exception as e:
-        logging.error(f"创建视频拼接列表文件时出错: {e}")
-        return False
-    base_video_path = temp_run_dir / "base_video_no_subs.mp4"
-    success_concat = concatenate_videos(concat_list_file, base_video_path)
-    if concat_list_file.exists():
-        try: concat_list_file.unlink()
+        logging.error(f"PyAV 合成视频时出错: {e}", exc_info=True)
+        if container is not None:
+            try: container.close()
+            except Exception: pass
+        try: output_path.unlink(missing_ok=True)
         except OSError: pass
-    if not success_concat:
-        logging.error("拼接视频片段失败。")
         return False
 
-    # --- 3. 生成字幕 (保持不变) ---
-    logging.info("步骤 3: 生成字幕文件 (ASR)")
-    audio_segment_paths = [d.get('audio_path') for d in processed_data if d.get('audio_duration', 0) > 0.01] # 只合并有效音频
-    subtitle_file_path = temp_run_dir / "subtitles.srt"
-    subtitles_generated = False
-    if audio_segment_paths: # 只有存在有效音频时才尝试生成字幕
-        subtitles_generated = generate_subtitles(
-            audio_segment_paths,
-            subtitle_file_path,
-            temp_run_dir
+
+def encode_base_video_by_segments(
+    segment_plan: "Iterable[dict]",
+    temp_run_dir: Path,
+    progress: "Callable[[float], None] | None" = None
+) -> Path | None:
+    """
+    逐片段编码 -> concat 拼接，返回不带字幕的基础视频路径，失败返回 None。
+
+    segment_plan 可以是生成器：每产出一个片段就立即提交编码，不必等全部片段就绪
+    (见 create_video_from_stream)。segment_plan 为列表时，每完成一个视频片段回调一次 progress (0~1)。
+    """
+    temp_segments_dir = temp_run_dir / "video_segments"
+    temp_segments_dir.mkdir(exist_ok=True)
+
+    # --- 1. 并行编码各片段的音频 (AAC 裸流) 和视频 (片段之间互相独立) ---
+    def _build_segment_audio(seg: dict, aac_frames: int) -> bool:
+        return encode_segment_audio(
+            seg['audio_path'], aac_frames,
+            temp_segments_dir / f"segment_{seg['slide_number']}.aac"
         )
-    else:
-        logging.info("没有有效时长的音频文件，跳过字幕生成。")
 
+    def _build_segment(seg: dict, video_frames: int) -> Path | None:
+        segment_output_path = temp_segments_dir / f"segment_{seg['slide_number']}.h264" # 裸视频流，音频为同名 .aac
+        if create_video_segment(seg['image_path'], seg['duration'], segment_output_path,
+                                prepared=seg.get('prepared', False), video_frames=video_frames):
+            return segment_output_path
+        logging.error(f"未能创建幻灯片 {seg['slide_number']} 的视频片段。")
+        return None
+
+    max_workers = os.cpu_count() or 1 # 线程按需创建，片段数较少时不会多开
+    if detect_hw_encoder() == 'nvenc':
+        max_workers = min(max_workers, NVENC_MAX_SESSIONS)
+    logging.info(f"使用 FFmpeg 并行生成各幻灯片的音频与视频片段 (视频并发数: {max_workers})")
+    # 音频编码很轻，放在独立的线程池里与视频编码同时进行，而不是先等全部音频完成
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as audio_pool, \
+         ThreadPoolExecutor(max_workers=max_workers) as video_pool:
+        audio_futures, video_futures = [], []
+        total = len(segment_plan) if progress is not None and isinstance(segment_plan, list) else 0
+        completed = collections.Counter()
+        completed_lock = threading.Lock()
+
+        def _on_segment_done(_future):
+            with completed_lock:
+                completed['video'] += 1
+                done = completed['video']
+            progress(done / total)
+
+        for seg, video_frames, aac_frames in elementary_frame_timeline(segment_plan):
+            audio_futures.append(audio_pool.submit(_build_segment_audio, seg, aac_frames))
+            video_futures.append(video_pool.submit(_build_segment, seg, video_frames))
+            if total:
+                video_futures[-1].add_done_callback(_on_segment_done)
+        audio_ok = all(f.result() for f in audio_futures)
+        segment_files = [f.result() for f in video_futures] # 保持幻灯片顺序
+
+    if not audio_ok:
+        logging.error("部分幻灯片的音频编码失败。合成中止。")
+        return None
+    if not segment_files or None in segment_files:
+        logging.error("未能成功生成全部视频片段。合成中止。")
+        return None
+
+    # --- 2. 拼接视频片段 (按字节拼接裸码流，再一次封装为 MP4) ---
+    base_video_path = temp_run_dir / "base_video_no_subs.mp4"
+    logging.info("拼接视频片段")
+    if not concatenate_elementary_streams(segment_files, base_video_path):
+        logging.error("拼接视频片段失败。")
+        return None
+    return base_video_path
 
-    # --- 检查 SRT 文件有效性 (保持不变) ---
-    srt_is_valid = False
-    if subtitles_generated and subtitle_file_path.exists():
-        # ... (之前的 srt_is_valid 检查逻辑不变) ...
-        try:
-            if subtitle_file_path.stat().st_size > 5: # 稍微降低阈值
-                with open(subtitle_file_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line_strip = line.strip()
-                        if line_strip and not line_strip.isdigit() and '-->' not in line_strip:
-                            srt_is_valid = True
-                            break
-                if srt_is_valid: logging.info("生成的 SRT 字幕文件包含有效文本。")
-                else: logging.warning("生成的 SRT 文件为空或不包含有效文本内容。")
-            else: logging.warning("生成的 SRT 文件过小或为空。")
-        except Exception as e: logging.warning(f"检查 SRT 文件时出错: {e}")
 
-    # --- 4. 添加字幕 (调用修改后的 add_subtitles) ---
-    if srt_is_valid:
-        logging.info("步骤 4: 使用 FFmpeg 添加字幕")
+def move_file(src: Path, dst: Path) -> None:
+    """
+    移动文件：先尝试 os.replace (同一文件系统上一次原子重命名)，
+    跨文件系统 (EXDEV) 时才回退到 shutil.move —— 其复制在 Linux 上由 copyfile 走内核 sendfile。
+    """
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(os.fspath(src), os.fspath(dst))
+
+def finish_with_subtitles(
+    base_video_path: Path,
+    srt_file: Path | None,
+    temp_run_dir: Path,
+    output_video_path: Path,
+    progress: "Callable[[float], None] | None" = None,
+    duration: float = 0.0
+) -> bool:
+    """
+    (可选) 为基础视频添加字幕 (烧录或软字幕，见 add_subtitles) 并移动到最终输出路径；失败时输出无字幕视频。
+    progress/duration 透传给 add_subtitles。
+    """
+    if srt_file is not None:
+        logging.info("使用 FFmpeg 添加字幕")
         final_video_with_subs_path = temp_run_dir / "final_video_with_subs.mp4"
         # 调用修改后的 add_subtitles 函数，它会读取 config 的样式
-        success_sub = add_subtitles(base_video_path, subtitle_file_path, final_video_with_subs_path)
+        success_sub = add_subtitles(base_video_path, srt_file, final_video_with_subs_path, progress, duration)
         if success_sub:
             logging.info("字幕添加成功。将带有字幕的视频作为最终输出。")
             try:
-                 shutil.move(str(final_video_with_subs_path), str(output_video_path))
+                 move_file(final_video_with_subs_path, output_video_path)
                  logging.info(f"最终视频 (带字幕) 已保存到: {output_video_path}")
-                 if base_video_path.exists(): base_video_path.unlink(missing_ok=True)
+                 base_video_path.unlink(missing_ok=True)
                  return True
             except Exception as e:
                  logging.error(f"移动最终带字幕视频时出错: {e}. 文件可能在: {final_video_with_subs_path}")
@@ -630,7 +1368,7 @@ def create_video_from_data(
             logging.error("添加字幕失败。将输出不带字幕的视频。")
             # 回退逻辑不变
             try:
-                 shutil.move(str(base_video_path), str(output_video_path))
+                 move_file(base_video_path, output_video_path)
                  logging.info(f"最终视频 (无字幕 - 因添加失败) 已保存到: {output_video_path}")
                  return True
             except Exception as e:
@@ -638,9 +1376,9 @@ def create_video_from_data(
                  return False
     else:
         # 跳过添加字幕逻辑不变
-        logging.info("步骤 4: 跳过添加字幕 (文件无效或生成失败)。")
+        logging.info("跳过添加字幕 (文件无效或生成失败)。")
         try:
-             shutil.move(str(base_video_path), str(output_video_path))
+             move_file(base_video_path, output_video_path)
              logging.info(f"最终视频 (无字幕) 已保存到: {output_video_path}")
              return True
         except Exception as e:
@@ -648,9 +1386,360 @@ def create_video_from_data(
              return False
 
 
+def subtitle_clips(segment_plan: list[dict]) -> list[tuple[str, float]]:
+    """
+    取出需要识别的音频片段及其在成片时间轴上的起点 (秒)。
+    起点按 segment_plan 累加，无音频 (静音/默认时长) 的幻灯片同样占用时间。
+    """
+    clips = []
+    start = 0.0
+    for seg in segment_plan:
+        if seg['audio_path']:
+            clips.append((seg['audio_path'], start))
+        start += seg['duration']
+    return clips
+
+
+def transcribe_to_srt(audio_clips: list[tuple[str, float]], temp_run_dir: Path) -> Path | None:
+    """对 subtitle_clips 给出的音频做 ASR 并检查 SRT，返回包含有效文本的字幕文件路径，否则返回 None。"""
+    subtitle_file_path = temp_run_dir / "subtitles.srt"
+    subtitles_generated = False
+    if audio_clips: # 只有存在有效音频时才尝试生成字幕
+        subtitles_generated = generate_subtitles(audio_clips, subtitle_file_path, temp_run_dir)
+    else:
+        logging.info("没有有效时长的音频文件，跳过字幕生成。")
+
+    # --- 检查 SRT 文件有效性 ---
+    srt_is_valid = False
+    if subtitles_generated and subtitle_file_path.exists():
+        try:
+            srt_bytes = subtitle_file_path.read_bytes()
+            if len(srt_bytes) > 5: # 稍微降低阈值
+                # 常见情况：去掉序号/时间轴用到的字符后仍有剩余字节，即说明存在文本 (C 层面一次完成)；
+                # 只有剩余为空 (如纯数字文本) 时才逐行扫描
+                srt_is_valid = bool(srt_bytes.translate(None, _SRT_SKELETON_BYTES)) or srt_has_text(srt_bytes)
+                if srt_is_valid: logging.info("生成的 SRT 字幕文件包含有效文本。")
+                else: logging.warning("生成的 SRT 文件为空或不包含有效文本内容。")
+            else: logging.warning("生成的 SRT 文件过小或为空。")
+        except Exception as e: logging.warning(f"检查 SRT 文件时出错: {e}")
+    return subtitle_file_path if srt_is_valid else None
+
+
+def plan_segment(i: int, data: dict) -> dict | None:
+    """把 processed_data 的一条记录整理为合成用的片段 (绝对路径/确定时长)，图片无效时返回 None。"""
+    slide_num = data.get('slide_number', i + 1)
+    image_path_str = data.get('image_path')
+    audio_path_str = data.get('audio_path')
+    # !!! 关键: 获取准确的时长 !!!
+    duration = data.get('audio_duration') # 从传入数据获取
+
+    in_memory_image = data.get('image') # 可选：内存中的 PIL.Image / numpy 数组
+    if in_memory_image is not None:
+        image_path = in_memory_image
+    elif not image_path_str or regular_file_size(image_path_str) < 0:
+        logging.warning(f"幻灯片 {slide_num}: 图片路径无效或丢失。跳过此片段。")
+        return None
+    else:
+        image_path = os.path.abspath(image_path_str) # FFmpeg 只需要绝对路径，无需逐级解析符号链接
+    audio_size = regular_file_size(audio_path_str) if audio_path_str else -1 # 一次 stat，后面复用大小
+    audio_path = os.path.abspath(audio_path_str) if audio_size >= 0 else None
+
+    # --- 确定片段时长 ---
+    clip_duration = 0.0
+    if duration is not None and duration > 0.01: # 检查时长是否有效 (>0.01s)
+        clip_duration = duration
+        logging.debug(f"幻灯片 {slide_num}: 使用音频时长 {clip_duration:.3f}s")
+    else:
+        # 如果 duration 无效 (None, 0, 或太小)，使用默认时长
+        clip_duration = DEFAULT_SLIDE_DURATION
+        if audio_path:
+            logging.warning(f"幻灯片 {slide_num}: 音频时长无效或过短({duration}), 使用默认展示时长 {clip_duration}s")
+        else:
+            logging.info(f"幻灯片 {slide_num}: 无音频，使用默认展示时长 {clip_duration}s")
+    # --- ----------------- ---
+
+    # 如果用了默认时长，则不合并音频
+    if audio_path and (clip_duration != duration or audio_size <= 100):
+        audio_path = None
+
+    return {
+        'slide_number': slide_num,
+        'image_path': image_path,
+        'duration': clip_duration,
+        'audio_path': audio_path,
+    }
+
+
+# --- 视频合成主函数 (重写) ---
+def create_video_from_data(
+    processed_data: list[dict],
+    temp_run_dir: Path,
+    output_video_path: Path,
+    progress_callback: "Callable[[float], None] | None" = None
+) -> bool:
+    """
+    根据处理好的数据，使用 FFmpeg 合成最终视频 (无转场)。
+    确保使用正确的音频时长，并应用字幕样式。
+
+    Args:
+        processed_data: 字典列表，包含幻灯片信息。
+        temp_run_dir: 临时工作目录。
+        output_video_path: 最终视频输出路径。
+        progress_callback: (可选) 视频编码进度回调，参数为 0~1 (可能在工作线程中调用)。
+
+    Returns:
+        bool: 成功返回 True，失败返回 False。
+    """
+    logging.info("--- 开始基于 FFmpeg 的视频合成流程 ---")
+    if not processed_data:
+        logging.error("输入数据为空，无法合成视频。")
+        return False
+    if FFMPEG_PATH_RESOLVED is None:
+         logging.error("FFmpeg 路径未设置，无法合成视频。")
+         return False
+
+    # 路径只解析一次，之后向下传递绝对路径字符串
+    temp_run_dir = temp_run_dir.resolve()
+    output_video_path = output_video_path.resolve()
+
+    # --- 1. 整理各幻灯片片段 (图片/时长/音频) ---
+    logging.info("步骤 1: 整理各幻灯片的图片、时长与音频")
+    segment_plan = [seg for i, data in enumerate(processed_data) if (seg := plan_segment(i, data)) is not None]
+
+    if not segment_plan:
+        logging.error("没有可用于合成的幻灯片片段。")
+        return False
+
+    # --- 2. 生成字幕 (ASR 只依赖音频，放到后台线程与视频编码并行执行) ---
+    logging.info("步骤 2: 后台生成字幕文件 (ASR)")
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr") as asr_pool:
+        # 字幕起点取自 segment_plan (实际的视频时间轴)；在提交前取出，避免与下面的图片预处理并发读写
+        srt_future = asr_pool.submit(transcribe_to_srt, subtitle_clips(segment_plan), temp_run_dir)
+        # 每张图片只缩放/填充一次，而不是在 FFmpeg 滤镜链中对每一帧重复执行 (与 ASR 并行)
+        prepare_slide_images(segment_plan, temp_run_dir / "prepared_images")
+        return _render_final_video(segment_plan, srt_future, temp_run_dir, output_video_path, progress_callback)
+
+
+def _render_final_video(
+    segment_plan: list[dict],
+    srt_future,
+    temp_run_dir: Path,
+    output_video_path: Path,
+    progress_callback: "Callable[[float], None] | None" = None
+) -> bool:
+    """
+    按配置的后端合成视频；只在真正需要字幕时才等待 ASR 结果。
+
+    progress_callback 覆盖整个合成过程：先编码后烧录字幕的流程中，片段编码只占前 SEGMENT_PROGRESS_SHARE，
+    其余留给拼接后的字幕烧录 (整段重新编码，往往是最耗时的一步)。
+    """
+    total_duration = sum(seg['duration'] for seg in segment_plan)
+
+    def _stage(low: float, high: float):
+        """把某一步的 0~1 进度映射到整体进度的 [low, high] 区间。"""
+        if progress_callback is None:
+            return None
+        return lambda fraction: progress_callback(low + (high - low) * min(1.0, fraction))
+
+    # 编码后还要整段重新编码烧录字幕时，编码阶段只占一部分进度
+    encode_share = SEGMENT_PROGRESS_SHARE if HARDCODE_SUBTITLES else 1.0
+
+    # --- 3. 合成视频 ---
+    if RENDER_BACKEND == 'pyav':
+        if av is None:
+            logging.warning("配置要求使用 PyAV 后端，但未安装 'av' 库，改用 FFmpeg。")
+        else:
+            logging.info("步骤 3: 使用 PyAV 进程内合成 (与 ASR 并行)")
+            base_video_path = temp_run_dir / "base_video_no_subs.mp4"
+            if render_video_pyav(segment_plan, base_video_path):
+                return finish_with_subtitles(base_video_path, srt_future.result(), temp_run_dir, output_video_path,
+                                             _stage(encode_share, 1.0), total_duration)
+            logging.warning("PyAV 合成失败，回退到 FFmpeg 流程。")
+
+    # 单次合成需要所有图片都是文件 (只有一个 stdin 管道可用)
+    all_images_on_disk = all(isinstance(seg['image_path'], str) for seg in segment_plan)
+    if SINGLE_PASS_RENDER and not all_images_on_disk:
+        logging.info("存在内存中的幻灯片图片，使用逐片段管道合成。")
+    if SINGLE_PASS_RENDER and all_images_on_disk and not HARDCODE_SUBTITLES:
+        # 软字幕不参与编码：先与 ASR 并行单次合成无字幕视频，再封装字幕轨道
+        logging.info("步骤 3: 单次 FFmpeg 合成 (缩放 + 拼接，一次编码，与 ASR 并行) -> 封装软字幕")
+        base_video_path = temp_run_dir / "base_video_no_subs.mp4"
+        if render_video_single_pass(segment_plan, None, base_video_path, temp_run_dir / "ffmpeg.log", progress_callback): # 软字幕封装很快
+            return finish_with_subtitles(base_video_path, srt_future.result(), temp_run_dir, output_video_path)
+        logging.warning("单次合成失败，回退到逐片段合成流程。")
+    elif SINGLE_PASS_RENDER and all_images_on_disk:
+        # 单次合成在同一次编码中烧录字幕，必须先等待 ASR 完成
+        srt_file = srt_future.result()
+        logging.info("步骤 3: 单次 FFmpeg 合成 (缩放 + 拼接 + 字幕，一次编码)")
+        # 先写到临时目录，成功后再移动到最终位置，失败时不会覆盖或删除用户已有的同名视频
+        single_pass_output = temp_run_dir / f"single_pass_output{output_video_path.suffix}"
+        if render_video_single_pass(segment_plan, srt_file, single_pass_output, temp_run_dir / "ffmpeg.log", progress_callback):
+            try:
+                move_file(single_pass_output, output_video_path)
+            except Exception as e:
+                logging.error(f"移动最终视频时出错: {e}. 文件可能在: {single_pass_output}")
+                return False
+            logging.info(f"最终视频{' (带字幕)' if srt_file else ' (无字幕)'} 已保存到: {output_video_path}")
+            return True
+        logging.warning("单次合成失败，回退到逐片段合成流程。")
+
+    logging.info("步骤 3: 逐片段合成 (片段编码 -> 拼接，与 ASR 并行 -> 字幕)")
+    base_video_path = encode_base_video_by_segments(segment_plan, temp_run_dir, _stage(0.0, encode_share))
+    if base_video_path is None:
+        return False
+    return finish_with_subtitles(base_video_path, srt_future.result(), temp_run_dir, output_video_path,
+                                 _stage(encode_share, 1.0), total_duration)
+
+
+def create_video_from_stream(
+    records: "Iterable[dict]",
+    temp_run_dir: Path,
+    output_video_path: Path
+) -> bool:
+    """
+    create_video_from_data 的流式版本：records 按幻灯片顺序逐条产出 (如 TTS 每完成一张就产出一条)，
+    每收到一条就开始编码该片段，上游剩余的语音合成被已开始的编码掩盖。
+    全部片段要到最后才齐，所以只走逐片段编码 + 裸码流拼接流程，ASR 在收齐后执行。
+
+    Args:
+        records: 与 processed_data 元素相同结构的字典，可以是阻塞的生成器 (如读取 queue.Queue)。
+        temp_run_dir: 临时工作目录。
+        output_video_path: 最终视频输出路径。
+
+    Returns:
+        bool: 成功返回 True，失败返回 False。
+    """
+    logging.info("--- 开始基于 FFmpeg 的流式视频合成流程 ---")
+    if FFMPEG_PATH_RESOLVED is None:
+         logging.error("FFmpeg 路径未设置，无法合成视频。")
+         return False
+
+    temp_run_dir = temp_run_dir.resolve()
+    output_video_path = output_video_path.resolve()
+    prepared_dir = temp_run_dir / "prepared_images"
+    prepared_dir.mkdir(parents=True, exist_ok=True)
+    planned: list[dict] = [] # 收齐后交给 ASR
+
+    def _segments():
+        for i, data in enumerate(records):
+            seg = plan_segment(i, data)
+            if seg is None:
+                continue
+            planned.append(seg)
+            # 收到即缩放/填充到统一分辨率，编码时滤镜链只需转换像素格式 (与 prepare_slide_images 相同)
+            _prepare_segment_image(seg, prepared_dir, i)
+            yield seg
+
+    logging.info("逐片段合成 (每收到一张幻灯片就开始编码 -> 拼接 -> 字幕)")
+    base_video_path = encode_base_video_by_segments(_segments(), temp_run_dir)
+    if base_video_path is None:
+        return False
+    return finish_with_subtitles(base_video_path, transcribe_to_srt(subtitle_clips(planned), temp_run_dir), temp_run_dir, output_video_path)
 
 
 # --- 主程序入口与测试 (使用 FFmpeg 版本) ---
+MOCK_TTS_RATE = 180 # (测试用) pyttsx3 语速
+MOCK_TTS_VOICE_ID = f"pyttsx3-default@{MOCK_TTS_RATE}" # (测试用) 参与缓存键，换语音/语速后旧缓存自然失效
+MOCK_TTS_CACHE_DIRNAME = "mock_tts" # 位于用户缓存目录 (见 user_cache_dir)，跨运行复用
+MOCK_TTS_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+@functools.lru_cache(maxsize=1)
+def get_mock_tts_engine():
+    """
+    (测试用) 返回本进程的 pyttsx3 引擎 (首次调用时初始化，之后一直复用，不再销毁重建)。
+    pyttsx3 不是线程安全的，所以每个工作进程各自持有一个。
+    """
+    import pyttsx3
+    engine = pyttsx3.init()
+    engine.setProperty('rate', MOCK_TTS_RATE) # 设置语速
+    return engine
+
+def _mock_tts_synthesize(note_text: str, audio_path_str: str) -> None:
+    """(测试用) 在工作进程中用 pyttsx3 合成一段旁白到 WAV。"""
+    tts_engine = get_mock_tts_engine()
+    tts_engine.save_to_file(note_text, audio_path_str)
+    tts_engine.runAndWait() # 等待文件保存
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """硬链接 src 到 dst (只增加一个目录项)；跨文件系统或不支持硬链接时复制。"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def mock_tts_get_or_synth(voice_id: str, note_text: str, out_path: Path, cache_dir: Path) -> float:
+    """
+    (测试用) 按 sha256(voice_id|note) 查找缓存的 WAV：命中则链接到 out_path，未命中则合成后写入缓存。
+    返回音频时长 (失败返回 0.0)。
+    """
+    key = hashlib.sha256(f"{voice_id}|{note_text}".encode('utf-8')).hexdigest()
+    cached = cache_dir / f"{key}.wav"
+    if regular_file_size(cached) <= 100:
+        tmp_path = cache_dir / f"{key}.{os.getpid()}.tmp.wav" # 按进程区分，重复备注并发合成时互不覆盖
+        _mock_tts_synthesize(note_text, str(tmp_path))
+        if regular_file_size(tmp_path) <= 100:
+            with contextlib.suppress(OSError):
+                tmp_path.unlink()
+            return 0.0
+        os.replace(tmp_path, cached)
+    else:
+        logging.debug(f"TTS 缓存命中: {cached.name}")
+        with contextlib.suppress(OSError):
+            os.utime(cached) # relatime 挂载下读取不一定更新 atime，显式标记为最近使用
+    _link_or_copy(cached, out_path)
+    return get_wav_duration(out_path) # 获取实际生成的音频时长
+
+def trim_mock_tts_cache(cache_dir: Path, max_bytes: int = MOCK_TTS_CACHE_MAX_BYTES) -> None:
+    """(测试用) 按最近使用时间淘汰最旧的缓存 WAV，直到总大小低于 max_bytes。"""
+    trim_cache_dir(cache_dir, "*.wav", max_bytes)
+
+MOCK_SCRATCH_MIN_FREE_BYTES = 512 * 1024 * 1024 # 内存盘剩余空间低于此值时改用磁盘上的临时目录
+
+def ram_scratch_dir(prefix: str, min_free_bytes: int = MOCK_SCRATCH_MIN_FREE_BYTES) -> Path:
+    """
+    (测试用) 在 tmpfs (/dev/shm) 上新建一个唯一的临时目录；不可用或剩余空间不足时退回系统临时目录。
+    目录名唯一，多个进程/用户同时运行互不干扰；由调用方负责删除。
+    """
+    shm = Path("/dev/shm")
+    base = None
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        try:
+            if shutil.disk_usage(shm).free >= min_free_bytes:
+                base = str(shm)
+        except OSError:
+            pass
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=base))
+
+def _mock_tts_worker(note_text: str, audio_path_str: str, cache_dir_str: str) -> float:
+    """(测试用) 工作进程入口：经磁盘缓存合成一段旁白，返回时长 (失败返回 0.0)。"""
+    return mock_tts_get_or_synth(MOCK_TTS_VOICE_ID, note_text, Path(audio_path_str), Path(cache_dir_str))
+
+def _build_mock_record(slide_number: int, image_path: str, note_text: str | None, tts_future=None,
+                       audio_path: str | None = None, leader_audio_path: str | None = None) -> dict:
+    """
+    (测试用) 等待一张幻灯片的语音合成结果并构建它的数据记录 (与 process_presentation 的记录格式一致)。
+
+    leader_audio_path 不为空时，说明同样的备注已由组内第一张幻灯片合成，直接链接它的 WAV。
+    """
+    record = {'slide_number': slide_number, 'image_path': image_path, 'notes': note_text or "", # 确保 notes 是字符串
+              'audio_path': None, 'audio_duration': 0.0}
+    if tts_future is None: # 无备注文本
+        return record
+    audio_name = Path(audio_path).name
+    try:
+        duration = tts_future.result()
+        if duration > 0.01 and leader_audio_path: # 组长总在前面，此时它的 WAV 已写好
+            _link_or_copy(Path(leader_audio_path), Path(audio_path))
+    except Exception as e:
+        logging.error(f"    为幻灯片 {slide_number} 生成 TTS 音频时出错: {e}")
+        return record
+    if duration <= 0.01:
+        logging.warning(f"    TTS 未能生成有效音频 (文件为空或无法获取时长): {audio_name}")
+        return record
+    logging.info(f"    音频生成成功: {audio_name}, 时长: {duration:.2f}s")
+    record.update(audio_path=audio_path, audio_duration=duration)
+    return record
+
 # --- 主程序入口与测试 (使用 FFmpeg 版本 + 真实语音模拟) ---
 if __name__ == "__main__":
     logging.info("--- 开始测试基于 FFmpeg 的视频合成模块 (使用 TTS 生成模拟语音) ---")
@@ -663,13 +1752,17 @@ if __name__ == "__main__":
         exit() # 如果无法导入 TTS，则无法进行此测试
 
     # --- 模拟输入数据和环境 ---
-    mock_run_dir = Path("./mock_run_for_ffmpeg_real_speech_test") # 使用新目录名
+    # 图片/旁白/片段/字幕都只被 FFmpeg 读一次，整个临时目录放在内存盘上；只有最终视频写到当前目录
+    mock_run_dir = ram_scratch_dir("ppt2video_mock_run_")
     mock_images_dir = mock_run_dir / "images"
     mock_audio_dir = mock_run_dir / "audio"
 
-    if mock_run_dir.exists(): shutil.rmtree(mock_run_dir)
+    mock_tts_cache_dir = user_cache_dir(MOCK_TTS_CACHE_DIRNAME) # 跨运行复用的缓存留在磁盘上，不污染当前目录
+
     mock_images_dir.mkdir(parents=True, exist_ok=True)
     mock_audio_dir.mkdir(parents=True, exist_ok=True)
+    mock_tts_cache_dir.mkdir(parents=True, exist_ok=True)
+    trim_mock_tts_cache(mock_tts_cache_dir)
 
     # --- 定义模拟的备注文本 (用于 TTS) ---
     mock_notes_texts = [
@@ -678,127 +1771,100 @@ if __name__ == "__main__":
         "现在我们来看第三部分，这里有一些重要信息。" # 幻灯片 3
     ]
 
-    mock_image_files = []
-    mock_audio_files = []
-    mock_durations = []
-    tts_engine = None # 初始化 TTS 引擎变量
-
-    try:
-        # --- 初始化 TTS 引擎 ---
-        tts_engine = pyttsx3.init()
-        tts_engine.setProperty('rate', 180) # 设置语速
-        logging.info("TTS 引擎初始化成功。")
-
-        # --- 创建模拟的图片和 *语音* 文件 ---
-        logging.info("正在创建模拟图片和生成语音文件...")
-        for i, note_text in enumerate(mock_notes_texts):
-            slide_num = i + 1
-            # 创建模拟图片 (颜色区分)
-            img_color = ['red', 'blue', 'green'][i % 3]
-            img_path = mock_images_dir / f"slide_{slide_num}.png"
-            try:
-                Image.new('RGB', (TARGET_WIDTH, 720), color=img_color).save(img_path)
-                mock_image_files.append(str(img_path))
-                logging.debug(f"  创建模拟图片: {img_path.name}")
-            except Exception as e:
-                 logging.error(f"  创建模拟图片 {slide_num} 失败: {e}")
-                 mock_image_files.append(None) # 添加占位符
-                 mock_audio_files.append(None)
-                 mock_durations.append(0.0)
-                 continue # 处理下一张
-
-            # 如果有备注文本，则生成语音
-            if note_text:
-                audio_path = mock_audio_dir / f"segment_{slide_num}.wav"
-                abs_audio_path = str(audio_path.resolve())
-                duration = 0.0
-                audio_file_path_str = None
-                try:
-                    logging.info(f"  使用 TTS 生成幻灯片 {slide_num} 的音频...")
-                    tts_engine.save_to_file(note_text, abs_audio_path)
-                    tts_engine.runAndWait() # 等待文件保存
-
-                    if audio_path.exists() and audio_path.stat().st_size > 100:
-                        # 获取实际生成的音频时长
-                        duration = get_wav_duration(audio_path)
-                        if duration > 0.01:
-                             logging.info(f"    音频生成成功: {audio_path.name}, 时长: {duration:.2f}s")
-                             audio_file_path_str = abs_audio_path
-                        else:
-                             logging.warning(f"    音频文件 {audio_path.name} 已生成但无法获取有效时长。")
-                             duration = 0.0 # 视为无效
-                    else:
-                        logging.warning(f"    TTS 未能保存文件或保存了空文件: {audio_path.name}")
+    mock_image_files = [None] * len(mock_notes_texts)
 
-                except Exception as e:
-                     logging.error(f"    为幻灯片 {slide_num} 生成 TTS 音频时出错: {e}")
-                finally:
-                    mock_audio_files.append(audio_file_path_str)
-                    mock_durations.append(duration)
-            else:
-                # 没有备注文本，无音频
-                logging.info(f"  幻灯片 {slide_num} 无备注文本，跳过音频生成。")
-                mock_audio_files.append(None)
-                mock_durations.append(0.0)
-
-        # --- 构建最终的 processed_data (过滤掉图片创建失败的项) ---
-        mock_processed_data = []
-        valid_count = 0
-        for i in range(len(mock_notes_texts)):
-             # 确保所有对应的数据都有效
-             if i < len(mock_image_files) and mock_image_files[i] and \
-                i < len(mock_audio_files) and \
-                i < len(mock_durations):
-                  mock_processed_data.append({
-                      'slide_number': i + 1,
-                      'image_path': mock_image_files[i],
-                      'notes': mock_notes_texts[i] or "", # 确保 notes 是字符串
-                      'audio_path': mock_audio_files[i],
-                      'audio_duration': mock_durations[i]
-                  })
-                  valid_count += 1
-             else:
-                 logging.warning(f"跳过构建幻灯片 {i+1} 的数据，因为图片或关联数据缺失。")
-
-        if valid_count > 0:
-             logging.info(f"成功构建了 {valid_count} 条模拟数据。")
-        else:
-             logging.error("未能构建任何有效的模拟数据。")
-             mock_processed_data = [] # 确保为空
-
-    except Exception as e:
-        logging.error(f"创建模拟文件或 TTS 初始化时出错: {e}")
-        mock_processed_data = [] # 出错则清空数据
-    finally:
-        # 清理 TTS 引擎
-        if tts_engine:
-            del tts_engine
+    # --- 创建模拟图片 (颜色区分) ---
+    logging.info("正在创建模拟图片...")
+    for i in range(len(mock_notes_texts)):
+        slide_num = i + 1
+        img_color = ['red', 'blue', 'green'][i % 3]
+        img_path = mock_images_dir / f"slide_{slide_num}.bmp" # 纯色测试图无需 PNG 的 zlib 压缩
+        try:
+            Image.new('RGB', (TARGET_WIDTH, 720), color=img_color).save(img_path)
+            mock_image_files[i] = str(img_path)
+            logging.debug(f"  创建模拟图片: {img_path.name}")
+        except Exception as e:
+            logging.error(f"  创建模拟图片 {slide_num} 失败: {e}")
+
+    tts_jobs = {
+        i: str((mock_audio_dir / f"segment_{i + 1}.wav").resolve())
+        for i, (note_text, image_path) in enumerate(zip(mock_notes_texts, mock_image_files))
+        if note_text and image_path
+    }
+    for i, note_text in enumerate(mock_notes_texts):
+        if not note_text:
+            logging.info(f"  幻灯片 {i + 1} 无备注文本，跳过音频生成。")
+    # 相同的备注只合成一次：每组的第一张幻灯片负责合成，其余硬链接它的 WAV
+    note_groups: dict[str, list[int]] = collections.defaultdict(list)
+    for i in tts_jobs:
+        note_groups[mock_notes_texts[i]].append(i)
+
+    # --- 生产者: 工作进程并行合成语音，按幻灯片顺序产出记录；消费者: 每收到一条就开始编码该片段 ---
+    records_queue = queue.Queue(maxsize=4) # 有界队列：编码跟不上时让生产者等待
+
+    def _produce_records():
+        try:
+            workers = max(1, min(len(note_groups), os.cpu_count() or 1))
+            with ProcessPoolExecutor(max_workers=workers) as tts_pool: # 每个工作进程一个 TTS 引擎
+                futures = {}
+                for note_text, indices in note_groups.items():
+                    future = tts_pool.submit(_mock_tts_worker, note_text, tts_jobs[indices[0]], str(mock_tts_cache_dir))
+                    futures.update(dict.fromkeys(indices, future))
+                for i, (note_text, image_path) in enumerate(zip(mock_notes_texts, mock_image_files)):
+                    if not image_path:
+                        logging.warning(f"跳过构建幻灯片 {i+1} 的数据，因为图片或关联数据缺失。")
+                        continue
+                    leader = note_groups[note_text][0] if i in futures else i
+                    records_queue.put(_build_mock_record(
+                        i + 1, image_path, note_text, futures.get(i), tts_jobs.get(i),
+                        tts_jobs[leader] if leader != i else None # 重复的备注：链接组内第一张幻灯片的 WAV
+                    ))
+        except Exception as e:
+            logging.error(f"生成 TTS 音频时出错: {e}")
+        finally:
+            records_queue.put(None) # 结束标记
 
     # --- 指定最终视频输出路径 ---
     final_output_video = Path("./final_video_ffmpeg_real_speech.mp4") # 新文件名
 
-    # --- 执行视频合成 ---
-    if mock_processed_data:
-        if final_output_video.exists(): final_output_video.unlink() # 确保输出文件不存在
+    # --- 执行视频合成 (与语音合成重叠进行) ---
+    if any(mock_image_files):
+        final_output_video.unlink(missing_ok=True) # 确保输出文件不存在
+
+        producer = threading.Thread(target=_produce_records, name="mock-tts", daemon=True)
+        producer.start()
+        stream_ended = threading.Event()
+
+        def _consume_records():
+            yield from iter(records_queue.get, None)
+            stream_ended.set()
 
-        success = create_video_from_data(
-            mock_processed_data,
+        success = create_video_from_stream(
+            _consume_records(),
             mock_run_dir,
             final_output_video
         )
+        if not stream_ended.is_set(): # 合成提前结束时取完剩余记录，避免生产者阻塞在 put 上
+            for _ in iter(records_queue.get, None):
+                pass
+        producer.join()
 
         if success and final_output_video.exists():
             print("\n--- 视频合成测试成功 (使用模拟真实语音) ---")
             print(f"最终视频已保存到: {final_output_video.resolve()}")
-            print(f"检查临时目录 '{mock_run_dir.name}' 中的 'subtitles.srt' 文件内容。")
+            subtitle_copy = final_output_video.with_suffix(".srt")
+            if (mock_run_dir / "subtitles.srt").exists(): # 临时目录在内存盘上，成功后删除；字幕复制出来供检查
+                shutil.copyfile(mock_run_dir / "subtitles.srt", subtitle_copy)
+                print(f"检查字幕文件 '{subtitle_copy.resolve()}' 的内容。")
             print("用播放器打开视频，检查画面、声音和字幕是否同步。")
-            # 可选清理: shutil.rmtree(mock_run_dir)
+            shutil.rmtree(mock_run_dir, ignore_errors=True)
         else:
             print("\n--- 视频合成测试失败 (使用模拟真实语音) ---")
             print("请检查上面的日志获取详细错误信息。")
             print(f"确保 FFmpeg 命令 '{FFMPEG_PATH}' 可执行。")
-            print(f"检查临时目录 '{mock_run_dir.name}' 中的文件。")
+            print(f"检查临时目录 '{mock_run_dir}' 中的文件 (检查完请删除，它可能占用内存盘)。")
     else:
         print("未能生成有效的模拟数据，无法进行视频合成测试。")
+        shutil.rmtree(mock_run_dir, ignore_errors=True)
 
     logging.info("--- 基于 FFmpeg+模拟语音 的视频合成模块测试结束 ---")
\ No newline at end of file
@@ -1,5 +1,6 @@
 import sys
 import os
+import tempfile
 from pathlib import Path
 import logging
 
@@ -8,11 +9,11 @@ from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QComboBox, QPushButton, QMessageBox, QSizePolicy
 )
-from PyQt6.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt6.QtCore import QUrl, Qt, QTimer
+from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+from PyQt6.QtCore import QUrl, Qt, QTimer, QRunnable, QThreadPool, pyqtSignal
 
 # 导入我们自己的 TTS 管理器
-import tts_manager
+import tts_manager_edge as tts_manager # 使用别名
 
 # --- 配置日志 ---
 logging.basicConfig(
@@ -21,16 +22,71 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+PREVIEW_SLOT_COUNT = 2 # 试听文件轮换使用：一个可能正在播放，另一个用于写入新的试听音频
+PREVIEW_CLOSE_WAIT_MS = 2000 # 关闭窗口时最多等待正在进行的试听生成 (网络合成) 这么久
+
+class PreviewGenTask(QRunnable):
+    """
+    在线程池中把一个语音的试听音频写入 out_path，完成后通过 signal 发出 (voice_id, 文件路径)，失败时路径为空字符串。
+    QRunnable 不是 QObject，不能定义信号，所以由窗口提供信号；跨线程发射会排队到 GUI 线程执行。
+    """
+    def __init__(self, voice_id: str, out_path: str, signal):
+        super().__init__()
+        self.voice_id = voice_id
+        self.out_path = out_path
+        self.signal = signal
+
+    def run(self):
+        preview_file_path = tts_manager.generate_preview_audio(self.voice_id, out_path=self.out_path)
+        self.signal.emit(self.voice_id, preview_file_path or "")
+
+
+class VoiceLoadWorker(QRunnable):
+    """在线程池中获取可用语音列表，完成后通过 signal 发出 (出错时发出空列表)，避免阻塞 GUI 线程。"""
+    def __init__(self, signal):
+        super().__init__()
+        self.signal = signal
+
+    def run(self):
+        try:
+            voices = tts_manager.get_available_voices()
+        except Exception as e:
+            logging.error(f"获取可用语音列表时出错: {e}", exc_info=True)
+            voices = []
+        self.signal.emit(voices)
+
+
 class VoiceSelectorWindow(QWidget):
     """
     一个用于选择和试听 TTS 语音的 PyQt 窗口。
     """
+    previewReady = pyqtSignal(str, str) # (voice_id, 试听文件路径，失败时为空)
+    voicesLoaded = pyqtSignal(list) # 后台加载到的语音列表
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.current_preview_file = None # 存储当前预览文件的路径，用于稍后删除
-        self.player = QMediaPlayer(self) # 创建媒体播放器实例
+        self.current_preview_file = None # 当前加载到播放器中的预览文件路径
+        self.player = QMediaPlayer(self) # 创建媒体播放器实例 (整个窗口只用这一个)
+        self.audio_output = QAudioOutput(self) # Qt6 中播放器需要显式的音频输出才会出声
+        self.player.setAudioOutput(self.audio_output)
         self.player.mediaStatusChanged.connect(self.handle_media_status) # 连接状态变化信号
 
+        # --- 试听音频预取：选择变化时就在后台生成，点击试听时通常已就绪 ---
+        # 固定的几个试听文件轮换覆盖写入，而不是每次新建临时文件再删除上一个
+        slot_dir = Path(tempfile.gettempdir()).resolve() # 与 generate_preview_audio 返回的绝对路径保持一致
+        self._preview_slots = [str(slot_dir / f"voice_preview_{os.getpid()}_{i}.mp3") for i in range(PREVIEW_SLOT_COUNT)]
+        self._slot_idx = 0
+        self._prefetched: dict[str, str] = {} # voice_id -> 已生成的试听文件路径 (某个 slot)
+        self._prefetch_running = None # 正在生成的 voice_id (同一时间最多一个，保证不会覆盖正在播放的文件)
+        self._prefetch_next = None # 等待生成的 voice_id，只保留最新的一个，快速切换时旧的自然作废
+        self._latest_voice_id = None # 最近一次选中的语音
+        self._play_when_ready = None # 用户已点击试听、正在等待生成的语音
+        self._closing = False # 窗口已关闭：之后才完成的试听生成结果直接丢弃
+        self._preview_pool = QThreadPool(self)
+        self._preview_pool.setMaxThreadCount(1)
+        self.previewReady.connect(self._on_preview_ready)
+        self.voicesLoaded.connect(self._on_voices_loaded)
+
         self.initUI()
         self.load_voices()
 
@@ -47,14 +103,14 @@ class VoiceSelectorWindow(QWidget):
         lbl_select = QLabel('选择语音:', self)
 
         self.cmb_voices = QComboBox(self)
-        self.cmb_voices.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed) # 让下拉框水平扩展
+        self.cmb_voices.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed) # 让下拉框水平扩展
         self.cmb_voices.setToolTip("从系统中可用的语音选择一个") # 添加提示信息
-        # 当选择项变化时，可以考虑启用/禁用试听按钮（如果需要）
-        # self.cmb_voices.currentIndexChanged.connect(self.on_voice_selection_change)
+        # 当选择项变化时，在后台预取该语音的试听音频
+        self.cmb_voices.currentIndexChanged.connect(self.on_voice_selection_change)
 
-        btn_preview = QPushButton('试听选中语音', self)
-        btn_preview.setToolTip("播放选定语音的简短示例")
-        btn_preview.clicked.connect(self.preview_selected_voice) # 连接按钮点击事件
+        self.btn_preview = QPushButton('试听选中语音', self)
+        self.btn_preview.setToolTip("播放选定语音的简短示例")
+        self.btn_preview.clicked.connect(self.preview_selected_voice) # 连接按钮点击事件
 
         self.lbl_status = QLabel('状态: 请选择语音进行试听', self)
         self.lbl_status.setStyleSheet("color: gray;") # 设置初始状态颜色
@@ -64,19 +120,22 @@ class VoiceSelectorWindow(QWidget):
         form_layout.addWidget(self.cmb_voices)
 
         main_layout.addLayout(form_layout)
-        main_layout.addWidget(btn_preview)
+        main_layout.addWidget(self.btn_preview)
         main_layout.addWidget(self.lbl_status)
         # main_layout.addStretch(1) # 添加伸缩项，让控件靠上 (如果需要)
 
         self.setLayout(main_layout)
 
     def load_voices(self):
-        """加载可用语音到下拉框"""
+        """在后台加载可用语音，完成后由 _on_voices_loaded 填充下拉框"""
         self.lbl_status.setText('状态: 正在加载可用语音...')
         self.lbl_status.setStyleSheet("color: blue;")
-        QApplication.processEvents() # 处理事件，让状态文本更新显示
+        self.cmb_voices.setEnabled(False)
+        self.btn_preview.setEnabled(False)
+        QThreadPool.globalInstance().start(VoiceLoadWorker(self.voicesLoaded))
 
-        voices = tts_manager.get_available_voices()
+    def _on_voices_loaded(self, voices: list):
+        """(GUI 线程) 把加载到的语音填充到下拉框"""
         self.cmb_voices.clear() # 清空现有项
 
         if not voices:
@@ -84,11 +143,7 @@ class VoiceSelectorWindow(QWidget):
             self.lbl_status.setStyleSheet("color: red;")
             QMessageBox.warning(self, "无可用语音", "未能检测到任何 TTS 语音。请确保您的系统已安装并配置了 TTS 引擎（如 Windows SAPI 语音）。")
             self.cmb_voices.setEnabled(False) # 禁用下拉框
-            # self.findChild(QPushButton, '试听选中语音').setEnabled(False) # 禁用按钮，如果用名字查找的话
-            # 更健壮的方式是保存按钮引用
-            preview_button = self.findChild(QPushButton)
-            if preview_button:
-                preview_button.setEnabled(False)
+            self.btn_preview.setEnabled(False)
             return
 
         logging.info(f"找到 {len(voices)} 个语音，正在填充下拉框...")
@@ -99,18 +154,65 @@ class VoiceSelectorWindow(QWidget):
         logging.info("下拉框填充完毕。")
 
         self.cmb_voices.setEnabled(True)
-        preview_button = self.findChild(QPushButton)
-        if preview_button:
-            preview_button.setEnabled(True)
+        self.btn_preview.setEnabled(True)
 
         self.lbl_status.setText('状态: 语音加载完成，请选择并试听。')
         self.lbl_status.setStyleSheet("color: green;")
 
-    # 可选：如果需要在选择变化时做些事
-    # def on_voice_selection_change(self, index):
-    #     selected_id = self.cmb_voices.itemData(index)
-    #     logging.debug(f"下拉框选择变化: Index={index}, ID='{selected_id}'")
-        # 这里可以根据需要更新状态或启用/禁用按钮
+    def on_voice_selection_change(self, index):
+        """下拉框选择变化时，在后台预取该语音的试听音频"""
+        selected_id = self.cmb_voices.itemData(index) if index >= 0 else None
+        logging.debug(f"下拉框选择变化: Index={index}, ID='{selected_id}'")
+        self._latest_voice_id = selected_id
+        if self._play_when_ready and self._play_when_ready != selected_id:
+            self._play_when_ready = None # 选择已变化，取消对旧语音的等待播放
+            self.lbl_status.setText('状态: 请选择语音进行试听')
+            self.lbl_status.setStyleSheet("color: gray;")
+        if selected_id:
+            self._start_prefetch(selected_id)
+
+    def _take_preview_slot(self) -> str:
+        """轮换取下一个试听文件 (跳过播放器当前加载的文件)，并作废之前缓存在其中的语音"""
+        for _ in range(len(self._preview_slots)):
+            slot = self._preview_slots[self._slot_idx]
+            self._slot_idx = (self._slot_idx + 1) % len(self._preview_slots)
+            if slot != self.current_preview_file:
+                break
+        self._prefetched = {v: p for v, p in self._prefetched.items() if p != slot}
+        return slot
+
+    def _start_prefetch(self, voice_id: str):
+        """提交后台生成任务 (已缓存或已在生成中时不重复提交；有任务在运行时排在其后)"""
+        cached = self._prefetched.get(voice_id)
+        if (cached and os.path.exists(cached)) or voice_id == self._prefetch_running:
+            return
+        if self._prefetch_running is not None:
+            self._prefetch_next = voice_id
+            return
+        self._prefetch_running = voice_id
+        self._preview_pool.start(PreviewGenTask(voice_id, self._take_preview_slot(), self.previewReady))
+
+    def _on_preview_ready(self, voice_id: str, preview_file_path: str):
+        """(GUI 线程) 后台生成完成：记录缓存；如果用户正在等这个语音，立即播放；然后开始下一个预取"""
+        self._prefetch_running = None
+        if self._closing: # 关闭后才完成的任务：删除刚写出的文件，不再播放或预取
+            if preview_file_path:
+                self._delete_file(preview_file_path)
+            return
+        if preview_file_path:
+            logging.info(f"试听音频已生成: {preview_file_path}")
+            self._prefetched[voice_id] = preview_file_path
+        if voice_id == self._play_when_ready:
+            self._play_when_ready = None
+            if preview_file_path:
+                self._play_preview(preview_file_path) # 先更新播放器中的文件，下一个任务才不会选中它
+            else:
+                self.lbl_status.setText('状态: 生成试听音频失败。')
+                self.lbl_status.setStyleSheet("color: red;")
+                QMessageBox.critical(self, "错误", "生成试听音频失败，请查看日志了解详情。")
+        next_voice_id, self._prefetch_next = self._prefetch_next, None
+        if next_voice_id in (self._latest_voice_id, self._play_when_ready):
+            self._start_prefetch(next_voice_id)
 
     def get_selected_voice_id(self) -> str | None:
         """获取当前下拉框中选定的语音 ID"""
@@ -129,76 +231,72 @@ class VoiceSelectorWindow(QWidget):
             QMessageBox.information(self, "提示", "请先选择一个语音。")
             return
 
+        # 预取命中：直接播放
+        preview_file_path = self._prefetched.get(selected_voice_id)
+        if preview_file_path and os.path.exists(preview_file_path):
+            self._play_preview(preview_file_path)
+            return
+
+        # 未命中：在后台生成 (或等待已在进行的预取)，完成后自动播放，界面不阻塞
         self.lbl_status.setText(f'状态: 正在生成 "{self.cmb_voices.currentText()}" 的试听音频...')
         self.lbl_status.setStyleSheet("color: blue;")
-        QApplication.processEvents() # 强制 UI 更新
+        self._play_when_ready = selected_voice_id
+        self._start_prefetch(selected_voice_id)
 
-        # --- 在生成新预览前，尝试清理上一个临时文件 ---
-        self.cleanup_previous_preview_file()
+    def _play_preview(self, preview_file_path: str):
+        """用同一个 QMediaPlayer 播放试听文件"""
+        self.current_preview_file = preview_file_path
+        self.lbl_status.setText('状态: 正在播放试听音频...')
+        self.lbl_status.setStyleSheet("color: purple;")
 
-        # 调用 TTS 管理器生成预览音频
-        preview_file_path = tts_manager.generate_preview_audio(selected_voice_id)
-
-        if preview_file_path:
-            self.current_preview_file = preview_file_path # 存储新文件的路径
-            logging.info(f"试听音频已生成: {preview_file_path}")
-            self.lbl_status.setText('状态: 正在播放试听音频...')
-            self.lbl_status.setStyleSheet("color: purple;")
-
-            # 使用 QMediaPlayer 播放
-            media_url = QUrl.fromLocalFile(preview_file_path)
-            media_content = QMediaContent(media_url)
-            self.player.setMedia(media_content)
-            self.player.play()
-
-        else:
-            self.lbl_status.setText('状态: 生成试听音频失败。')
-            self.lbl_status.setStyleSheet("color: red;")
-            QMessageBox.critical(self, "错误", "生成试听音频失败，请查看日志了解详情。")
+        # 使用 QMediaPlayer 播放
+        self.player.setSource(QUrl.fromLocalFile(preview_file_path))
+        self.player.play()
 
     def handle_media_status(self, status):
         """处理 QMediaPlayer 的状态变化"""
-        if status == QMediaPlayer.EndOfMedia:
+        if status == QMediaPlayer.MediaStatus.EndOfMedia:
             logging.info("试听音频播放结束。")
             self.lbl_status.setText('状态: 试听播放完毕。请选择其他语音或继续。')
             self.lbl_status.setStyleSheet("color: green;")
             # 可以在这里自动清理文件，但为了避免竞争条件，
-            # 我们选择在生成下一个预览或窗口关闭时清理
+            # 预览文件作为预取缓存保留，窗口关闭时统一清理
             # self.cleanup_previous_preview_file()
 
-        elif status == QMediaPlayer.InvalidMedia:
+        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
             logging.error("媒体文件无效或无法播放。")
             self.lbl_status.setText('状态: 无法播放试听音频文件。')
             self.lbl_status.setStyleSheet("color: red;")
             self.cleanup_previous_preview_file() # 尝试清理无效文件
 
-        elif status == QMediaPlayer.LoadingMedia:
+        elif status == QMediaPlayer.MediaStatus.LoadingMedia:
              logging.debug("正在加载媒体...")
              self.lbl_status.setText('状态: 正在加载试听音频...')
              self.lbl_status.setStyleSheet("color: gray;")
 
-        elif status == QMediaPlayer.LoadedMedia:
+        elif status == QMediaPlayer.MediaStatus.LoadedMedia:
              logging.debug("媒体加载完成.")
              # 状态会变为 StalledMedia 或 PlayingMedia
 
-        elif status == QMediaPlayer.StalledMedia:
+        elif status == QMediaPlayer.MediaStatus.StalledMedia:
              logging.warning("媒体播放暂停/缓冲中...")
              self.lbl_status.setText('状态: 试听音频缓冲中...')
              self.lbl_status.setStyleSheet("color: orange;")
 
 
     def cleanup_previous_preview_file(self):
-        """安全地删除上一个临时预览文件"""
-        if self.current_preview_file and os.path.exists(self.current_preview_file):
+        """安全地删除当前 (无效的) 预览文件，并从预取缓存中移除"""
+        if self.current_preview_file:
             try:
                 # 在删除前确保播放器已停止使用该文件
-                if self.player.state() == QMediaPlayer.PlayingState:
+                if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
                     self.player.stop() # 尝试停止播放
 
                 # 添加短暂延迟（可能有助于释放文件句柄，但非完全保证）
                 # QTimer.singleShot(100, lambda: self._delete_file(self.current_preview_file))
                 # 更直接的方式：
                 self._delete_file(self.current_preview_file)
+                self._prefetched = {v: p for v, p in self._prefetched.items() if p != self.current_preview_file}
                 self.current_preview_file = None # 清除引用
 
             except Exception as e:
@@ -207,17 +305,30 @@ class VoiceSelectorWindow(QWidget):
     def _delete_file(self, filepath):
         """实际执行文件删除"""
         try:
-            os.remove(filepath)
+            os.remove(filepath) # 直接删除，不存在时忽略，而不是先 exists() 再删除
             logging.info(f"已删除临时预览文件: {filepath}")
+        except FileNotFoundError:
+            pass
         except OSError as e:
             logging.warning(f"无法删除文件 '{filepath}': {e}")
         except Exception as e:
              logging.error(f"删除文件 '{filepath}' 时发生意外错误: {e}")
 
     def closeEvent(self, event):
-        """重写窗口关闭事件，确保清理最后的预览文件"""
-        logging.info("窗口关闭事件触发，清理最后的预览文件...")
-        self.cleanup_previous_preview_file()
+        """重写窗口关闭事件，确保清理所有试听文件"""
+        logging.info("窗口关闭事件触发，清理预览文件...")
+        self._closing = True
+        self._prefetch_next = None
+        self._preview_pool.clear() # 丢弃尚未开始的预取
+        # 正在进行的生成依赖网络，只等待有限时间；超时未完成的结果由 _on_preview_ready 丢弃
+        if not self._preview_pool.waitForDone(PREVIEW_CLOSE_WAIT_MS):
+            logging.warning("试听音频仍在生成，不再等待，直接关闭窗口。")
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.stop()
+        for slot in self._preview_slots:
+            self._delete_file(slot)
+        self._prefetched.clear()
+        self.current_preview_file = None
         event.accept() # 接受关闭事件
 
 # --- 主程序入口 ---
@@ -225,4 +336,4 @@ if __name__ == '__main__':
     app = QApplication(sys.argv)
     window = VoiceSelectorWindow()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec())
\ No newline at end of file